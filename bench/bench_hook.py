@@ -0,0 +1,187 @@
+"""
+Microbenchmarks for SpammerPlugin.on_send_message_hook.
+
+Runs the real plugin against the offline stubs in ``bench/stubs`` and reports,
+per scenario, the hook latency (mean/p50/p99) and what a single call allocates:
+peak traced bytes, bytes still alive after the call, and TLRPC objects created.
+
+    python bench/bench_hook.py                      # print a table
+    python bench/bench_hook.py --save-baseline      # also write bench/baseline.json
+    python bench/bench_hook.py --compare            # diff against bench/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import fixtures
+from fixtures import SendMessageParams, entities, make_plugin, photo_message
+
+from base_plugin import HookStrategy
+from client_utils import get_network
+from org.telegram.tgnet import TLObject
+
+DEFAULT_BASELINE = os.path.join(fixtures.BENCH_DIR, "baseline.json")
+
+
+def _stop_tasks(plugin):
+    """Returns the plugin to idle between iterations without touching the repeat memory."""
+    plugin._cleanup_task()
+    fixtures.reset_loopers()
+    get_network().sent.clear()
+
+
+class Scenario:
+    def __init__(self, name, make_params, expected, prime=None):
+        self.name = name
+        self.make_params = make_params
+        self.expected = expected
+        self.prime = prime
+
+    def setup(self):
+        plugin = make_plugin()
+        if self.prime:
+            plugin.on_send_message_hook(0, self.prime())
+            _stop_tasks(plugin)
+        return plugin
+
+
+SCENARIOS = [
+    Scenario(
+        "plain_message",
+        lambda: SendMessageParams("hey, are we still on for lunch tomorrow? [2] options"),
+        HookStrategy.DEFAULT,
+    ),
+    Scenario(
+        "spam_text",
+        lambda: SendMessageParams(".spam Hello **World** [50] [0.5]", entities=entities(("TL_messageEntityBold", 12, 5))),
+        HookStrategy.CANCEL,
+    ),
+    Scenario(
+        "spam_media_reply",
+        lambda: SendMessageParams(".spam [20]", reply_to=photo_message()),
+        HookStrategy.CANCEL,
+    ),
+    Scenario(
+        "repeat_command",
+        lambda: SendMessageParams(".spam"),
+        HookStrategy.CANCEL,
+        prime=lambda: SendMessageParams(".spam Hello **World** [50]", entities=entities(("TL_messageEntityBold", 12, 5))),
+    ),
+]
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(scenario, iterations, warmup):
+    plugin = scenario.setup()
+    hook = plugin.on_send_message_hook
+
+    for _ in range(warmup):
+        result = hook(0, scenario.make_params())
+        _stop_tasks(plugin)
+    if result.strategy != scenario.expected:
+        raise AssertionError(f"{scenario.name}: expected {scenario.expected}, hook returned {result.strategy}")
+
+    timings = []
+    for _ in range(iterations):
+        params = scenario.make_params()
+        start = time.perf_counter_ns()
+        hook(0, params)
+        timings.append(time.perf_counter_ns() - start)
+        _stop_tasks(plugin)
+
+    # Allocation pass, kept separate so tracing overhead does not skew the timings
+    alloc_iterations = max(1, iterations // 10)
+    peak_total = retained_total = tl_total = 0
+    tracemalloc.start()
+    for _ in range(alloc_iterations):
+        params = scenario.make_params()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        tl_before = TLObject.created
+        hook(0, params)
+        current, peak = tracemalloc.get_traced_memory()
+        tl_total += TLObject.created - tl_before
+        peak_total += peak - before
+        retained_total += current - before
+        del params
+        _stop_tasks(plugin)
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "mean_us": sum(timings) / len(timings) / 1000,
+        "p50_us": _percentile(timings, 0.50) / 1000,
+        "p99_us": _percentile(timings, 0.99) / 1000,
+        "peak_bytes": peak_total / alloc_iterations,
+        "retained_bytes": retained_total / alloc_iterations,
+        "tl_objects": tl_total / alloc_iterations,
+    }
+
+
+def print_table(results, baseline=None):
+    header = f"{'scenario':<20} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'peak B':>9} {'kept B':>9} {'TL obj':>7}"
+    if baseline:
+        header += f" {'vs base':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        line = (f"{name:<20} {row['mean_us']:>9.2f} {row['p50_us']:>9.2f} {row['p99_us']:>9.2f} "
+                f"{row['peak_bytes']:>9.0f} {row['retained_bytes']:>9.0f} {row['tl_objects']:>7.1f}")
+        base_row = (baseline or {}).get(name)
+        if base_row:
+            line += f" {row['mean_us'] / base_row['mean_us']:>7.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--scenario", action="append", help="Run only the named scenario (repeatable).")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, metavar="PATH")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="With --compare, exit non-zero if any mean latency exceeds baseline by this factor.")
+    args = parser.parse_args(argv)
+
+    selected = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    results = {s.name: run_scenario(s, args.iterations, args.warmup) for s in selected}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["scenarios"]
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        payload = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "iterations": args.iterations,
+            "scenarios": results,
+        }
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if baseline:
+        regressed = [name for name, row in results.items()
+                     if name in baseline and row["mean_us"] > baseline[name]["mean_us"] * args.threshold]
+        if regressed:
+            print(f"\nRegressed beyond {args.threshold:.2f}x: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Plugin load cost: import time, on_plugin_load time and which dependencies get loaded.
+
+Every sample runs in a fresh interpreter so nothing is cached between them.
+Alongside the timings it lists the client/Android modules imported by the time
+the plugin is loaded and has handled a plain message, and the ones that are only
+pulled in later when the settings page, FAQ and a dialog are opened. On a device
+each of those modules is a set of Java class lookups through Chaquopy, so the
+lists matter more than the stub timings.
+
+    python bench/bench_import.py --runs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import fixtures
+
+# Stub modules standing in for the client and Android APIs
+CLIENT_MODULES = ("android", "java", "org", "ui", "client_utils", "android_utils", "base_plugin", "markdown_utils")
+
+
+def _client_modules():
+    return {name for name in sys.modules if name.split(".")[0] in CLIENT_MODULES}
+
+
+def measure_once():
+    """Runs in the child interpreter and returns one sample."""
+    before = _client_modules()
+    started = time.perf_counter()
+    import repeater_pro
+    imported_ms = (time.perf_counter() - started) * 1000
+    plugin = repeater_pro.SpammerPlugin()
+    started = time.perf_counter()
+    plugin.on_plugin_load()
+    load_ms = (time.perf_counter() - started) * 1000
+    plugin.on_send_message_hook(0, fixtures.SendMessageParams("just a normal message"))
+    at_load = _client_modules() - before
+
+    plugin.create_settings()
+    plugin._show_faq_dialog(None)
+    plugin.show_info_dialog(object(), "title", "message")
+    plugin._copy_to_clipboard("address", "label")
+    later = _client_modules() - before - at_load
+    plugin.on_plugin_unload()
+    return {
+        "import_ms": imported_ms,
+        "on_plugin_load_ms": load_ms,
+        "loaded_at_startup": sorted(at_load),
+        "loaded_on_first_use": sorted(later),
+        "lazy_timings_ms": dict(getattr(getattr(repeater_pro, "LazyImports", None), "timings", {})),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Print the aggregated report as JSON.")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure_once()))
+        return 0
+
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"],
+                                check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = {
+        "runs": args.runs,
+        "import_ms_median": statistics.median(s["import_ms"] for s in samples),
+        "on_plugin_load_ms_median": statistics.median(s["on_plugin_load_ms"] for s in samples),
+        "loaded_at_startup": samples[0]["loaded_at_startup"],
+        "loaded_on_first_use": samples[0]["loaded_on_first_use"],
+        "lazy_timings_ms": samples[0]["lazy_timings_ms"],
+    }
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return 0
+    print(f"import repeater_pro   {report['import_ms_median']:.2f} ms (median of {args.runs} fresh interpreters)")
+    print(f"on_plugin_load        {report['on_plugin_load_ms_median']:.2f} ms")
+    print(f"loaded at startup     {', '.join(report['loaded_at_startup']) or 'none'}")
+    print(f"loaded on first use   {', '.join(report['loaded_on_first_use']) or 'none'}")
+    for name, ms in report["lazy_timings_ms"].items():
+        print(f"  {name:<32} {ms:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Equivalence fuzzing and timing of the command argument parser.
+
+`_parse_arguments` scans the trailing `[count]` / `[count] [delay]` groups from
+the end of the arguments. This script checks it against the original regex
+with its rsplit fallback (kept below as the reference) on random and structured
+inputs built from the characters that matter (brackets, digits, dots, spaces,
+U+2063, line breaks, non-ASCII digits), then times both on argument lengths up
+to Telegram's 4096-character message limit.
+
+    python bench/bench_parse_command.py
+    python bench/bench_parse_command.py --fuzz 200000 --seed 7
+    python bench/bench_parse_command.py --plugin /tmp/repeater_pro_old.py   # check another version
+"""
+import argparse
+import random
+import re
+import sys
+import timeit
+
+import fixtures
+
+MAX_MESSAGE_LENGTH = 4096
+
+# Characters the grammar cares about, plus a few that only look like they should
+ALPHABET = ["[", "]", "[", "]", "0", "1", "5", "9", ".", " ", " ", "⁣", "\n", "\t", "a", "Z", "٣", "²", "\U0001F600", " "]
+SEPARATORS = [" ", "", "⁣", " ⁣ ", "\n", "\t", "  "]
+
+
+def reference_parse(command_args):
+    """The parser as it was before the right-to-left scan."""
+    text_to_spam, count, delay = None, 0, 0.0
+    match = re.search(r'^(.*?)?[\s⁣]*\[(\d+)\](?:[\s⁣]*\[([0-9.]+)\])?$', command_args.strip())
+    if match:
+        text_content = match.group(1)
+        text_to_spam = text_content.strip() if text_content else None
+        count = int(match.group(2))
+        if match.group(3):
+            delay = float(match.group(3))
+    else:
+        parts = command_args.rsplit(' ', 1)
+        if len(parts) == 2 and parts[1].isdigit():
+            text_to_spam = parts[0].strip()
+            count = int(parts[1])
+        elif len(parts) == 1 and parts[0].isdigit():
+            text_to_spam = None
+            count = int(parts[0])
+    if text_to_spam == "":
+        text_to_spam = None
+    return text_to_spam, count, delay
+
+
+def _outcome(parse, command_args):
+    # Invalid numbers (e.g. "[1..2]" or a superscript count) raise in both versions
+    try:
+        return parse(command_args)
+    except ValueError as e:
+        return ("ValueError", type(e).__name__)
+
+
+def random_args(rng):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 24)))
+
+
+def structured_args(rng):
+    """Text followed by bracket groups, separators and occasional damage."""
+    parts = [random_args(rng) if rng.random() < 0.5 else rng.choice(["Hello", "Hi there", "**bold** text", "multi\nline", ""])]
+    for _ in range(rng.randint(0, 3)):
+        # Long runs cross the parser's first window
+        parts.append(rng.choice(SEPARATORS) * (rng.randint(1, 80) if rng.random() < 0.2 else 1))
+        content = rng.choice(["5", "50", "0", "1.5", "0.25", "1..2", ".", "", "12a", "٣", "²", "007", "9" * 70, "1." * 40])
+        parts.append(rng.choice(["[{}]", "[{}]", "{}", "[{}", "{}]"]).format(content))
+    if rng.random() < 0.3:
+        parts.append(rng.choice(SEPARATORS))
+    return "".join(parts)
+
+
+def fuzz(parse, iterations, rng):
+    mismatches = []
+    for index in range(iterations):
+        command_args = structured_args(rng) if index % 2 else random_args(rng)
+        expected = _outcome(reference_parse, command_args)
+        actual = _outcome(parse, command_args)
+        if expected != actual:
+            mismatches.append((command_args, expected, actual))
+    return mismatches
+
+
+def shapes(length):
+    """Argument strings of about `length` characters that stress different parts of the grammar."""
+    return {
+        "text [count]": "x" * (length - 5) + " [50]",
+        "text [count] [delay]": "x" * (length - 10) + " [50] [0.5]",
+        "bracket-heavy text": ("[1] " * (length // 4))[:length - 5] + " [50]",
+        "spaces before count": "a" + " " * (length - 5) + "[50]",
+        "separators, no match": ("a ⁣" * (length // 3 + 1))[:length - 1] + "]",
+        "digits, fallback": "1 " * (length // 2 - 1) + "50",
+    }
+
+
+def time_call(parse, command_args, repeat):
+    timer = timeit.Timer(lambda: parse(command_args))
+    number = max(1, repeat)
+    return min(timer.repeat(3, number)) / number * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fuzz", type=int, default=50000, help="Random inputs compared against the reference.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=200, help="Calls per timing sample.")
+    parser.add_argument("--plugin", help="Path of another repeater_pro.py to check instead of the working tree.")
+    args = parser.parse_args(argv)
+
+    module = fixtures.load_plugin_module(args.plugin)
+
+    def parse(command_args):
+        return module.SpammerPlugin._parse_arguments(None, command_args)
+
+    mismatches = fuzz(parse, args.fuzz, random.Random(args.seed))
+    print(f"fuzz: {args.fuzz} inputs, {len(mismatches)} mismatch(es)")
+    for command_args, expected, actual in mismatches[:10]:
+        print(f"  {command_args!r}: expected {expected!r}, got {actual!r}")
+
+    print(f"\n{'shape':<24} {'length':>6} {'regex us':>10} {'scan us':>10}")
+    for length in (16, 256, 1024, MAX_MESSAGE_LENGTH):
+        for name, command_args in shapes(length).items():
+            expected, actual = _outcome(reference_parse, command_args), _outcome(parse, command_args)
+            if expected != actual:
+                mismatches.append((command_args, expected, actual))
+            repeat = args.repeat if length <= 1024 else max(1, args.repeat // 10)
+            print(f"{name:<24} {len(command_args):>6} {time_call(reference_parse, command_args, repeat):>10.2f} "
+                  f"{time_call(parse, command_args, repeat):>10.2f}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
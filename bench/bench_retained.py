@@ -0,0 +1,77 @@
+"""
+Memory the plugin keeps alive after a spam command has finished.
+
+Each scenario sends a command through the hook, runs the task to completion in
+virtual time and drops the caller's references. It then reports the traced bytes
+still held and whether the replied-to MessageObject (carrying a large simulated
+thumbnail payload) is still reachable, e.g. through the repeat memory or a task
+closure.
+
+    python bench/bench_retained.py
+    python bench/bench_retained.py --plugin /tmp/repeater_pro_old.py   # compare another version
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+import weakref
+
+import fixtures
+from fixtures import EchoNetwork, SendMessageParams, entities, make_plugin, photo_message
+
+from android.os import SystemClock
+from client_utils import get_messages_controller, set_network
+
+PAYLOAD_BYTES = 512 * 1024
+
+SCENARIOS = {
+    "media_reply": lambda: SendMessageParams(".spam [5]", reply_to=photo_message(payload_bytes=PAYLOAD_BYTES)),
+    "spamdel_media_reply": lambda: SendMessageParams(".spamdel [5]", reply_to=photo_message(payload_bytes=PAYLOAD_BYTES)),
+    "text_reply": lambda: SendMessageParams(".spam Hello [5]", reply_to=photo_message(payload_bytes=PAYLOAD_BYTES)),
+    "text_entities": lambda: SendMessageParams(".spam Hello **World** [5]", entities=entities(("TL_messageEntityBold", 12, 5))),
+}
+
+
+def run_scenario(module, make_params):
+    SystemClock.use_virtual_time(0)
+    fixtures.reset_loopers()
+    network = EchoNetwork(rtt_ms=50)
+    previous = set_network(network)
+    try:
+        plugin = make_plugin({"confirmation_threshold": 1000}, module)
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        params = make_params()
+        reply = weakref.ref(params.replyToMsg) if params.replyToMsg is not None else None
+        plugin.on_send_message_hook(0, params)
+        fixtures.run_loopers_until_idle()
+        del params
+        network.sent.clear()
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        plugin.on_plugin_unload()
+        return {"retained_bytes": retained, "reply_alive": reply is not None and reply() is not None}
+    finally:
+        network.handler.getLooper().quit()
+        set_network(previous)
+        get_messages_controller().deleted.clear()
+        SystemClock.use_real_time()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--plugin", help="Path of another repeater_pro.py to measure instead of the working tree.")
+    args = parser.parse_args(argv)
+
+    module = fixtures.load_plugin_module(args.plugin)
+    print(f"{'scenario':<22} {'retained B':>11} {'reply message kept':>19}")
+    for name, make_params in SCENARIOS.items():
+        row = run_scenario(module, make_params)
+        print(f"{name:<22} {row['retained_bytes']:>11} {'yes' if row['reply_alive'] else 'no':>19}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+End-to-end cost of running spam tasks against the offline stubs.
+
+Starts a task through the send hook and drains every looper in virtual
+time, so a 500-message run completes instantly regardless of its delay. For
+each task type it reports the number of delete requests, the wall time per send
+and what each send allocates: TLRPC objects, Runnable proxies and peak traced memory.
+
+    python bench/bench_tasks.py --count 500
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+import fixtures
+from fixtures import EchoNetwork, SendMessageParams, entities, make_plugin, photo_message
+
+from android.os import SystemClock
+from client_utils import get_messages_controller, set_network
+from java.chaquopy import ProxyObject
+from org.telegram.tgnet import TLObject
+
+TASKS = {
+    "spam_text": lambda n: SendMessageParams(f".spam Hello **World** [{n}] [0.1]", entities=entities(("TL_messageEntityBold", 12, 5))),
+    "spam_numbered": lambda n: SendMessageParams(f".spam Hello **World** {{i}}/{{n}} [{n}] [0.1]", entities=entities(("TL_messageEntityBold", 12, 5))),
+    "spam_media": lambda n: SendMessageParams(f".spam [{n}] [0.1]", reply_to=photo_message()),
+    "spamdel_text": lambda n: SendMessageParams(f".spamdel Hello **World** [{n}] [0.1]", entities=entities(("TL_messageEntityBold", 15, 5))),
+    "spamdel_media": lambda n: SendMessageParams(f".spamdel [{n}] [0.1]", reply_to=photo_message()),
+}
+
+
+def run_task(name, count, trace_memory):
+    SystemClock.use_virtual_time(0)
+    fixtures.reset_loopers()
+    network = EchoNetwork(rtt_ms=50)
+    previous = set_network(network)
+    plugin = None
+    try:
+        plugin = make_plugin({"confirmation_threshold": count, "max_spam_limit": count})
+        params = TASKS[name](count)
+        if trace_memory:
+            tracemalloc.start()
+        tl_before, proxies_before = TLObject.created, ProxyObject.created
+        start = time.perf_counter_ns()
+        plugin.on_send_message_hook(0, params)
+        fixtures.run_loopers_until_idle()
+        elapsed = time.perf_counter_ns() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+        sends = len(network.sent)
+        return {
+            "sends": sends,
+            "deletions": sum(len(ids) for ids, *_ in get_messages_controller().deleted),
+            "delete_calls": len(get_messages_controller().deleted),
+            "us_per_send": elapsed / 1000 / max(1, sends),
+            "tl_per_send": (TLObject.created - tl_before - network.tl_objects) / max(1, sends),
+            "proxies_per_send": (ProxyObject.created - proxies_before) / max(1, sends),
+            "peak_bytes": peak,
+        }
+    finally:
+        if plugin is not None:
+            plugin.on_plugin_unload()
+        network.handler.getLooper().quit()
+        set_network(previous)
+        get_messages_controller().deleted.clear()
+        SystemClock.use_real_time()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--task", action="append", choices=sorted(TASKS))
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Skip the traced-memory column (faster timings).")
+    args = parser.parse_args(argv)
+
+    print(f"{'task':<15} {'sends':>6} {'deleted':>8} {'del calls':>9} {'us/send':>9} {'TL/send':>8} {'proxy/send':>11} {'peak B':>10}")
+    for name in args.task or list(TASKS):
+        row = run_task(name, args.count, not args.no_tracemalloc)
+        print(f"{name:<15} {row['sends']:>6} {row['deletions']:>8} {row['delete_calls']:>9} {row['us_per_send']:>9.2f} "
+              f"{row['tl_per_send']:>8.2f} {row['proxies_per_send']:>11.2f} {row['peak_bytes']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
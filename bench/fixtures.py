@@ -0,0 +1,169 @@
+"""
+Shared helpers for the offline benchmarks.
+
+Importing this module puts ``bench/stubs`` and the repository root on
+``sys.path`` so ``repeater_pro`` can be imported on plain CPython.
+"""
+import importlib.util
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+STUBS_DIR = os.path.join(BENCH_DIR, "stubs")
+
+for _path in (STUBS_DIR, REPO_ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+from android.os import Looper  # noqa: E402
+from java.util import ArrayList  # noqa: E402
+from org.telegram.tgnet import TLRPC  # noqa: E402
+
+USER_PEER = 777000
+CHANNEL_PEER = -1234567890  # Dialog id of a channel: its negated chat id
+
+
+def _register_channel():
+    from client_utils import get_messages_controller
+    channel = TLRPC.TL_channel()
+    channel.id = -CHANNEL_PEER
+    channel.access_hash = 4242
+    get_messages_controller().putChat(channel, False)
+
+
+_register_channel()
+
+
+class SendMessageParams:
+    """The subset of SendMessagesHelper.SendMessageParams the hook reads."""
+    def __init__(self, message, peer=USER_PEER, reply_to=None, entities=None):
+        self.message = message
+        self.peer = peer
+        self.replyToMsg = reply_to
+        self.entities = entities
+
+
+class MessageObject:
+    """A replied-to message; ``payload_bytes`` simulates the thumbnails a real MessageObject pins."""
+    def __init__(self, message_id, media=None, payload_bytes=0):
+        self.messageOwner = TLRPC.TL_message()
+        self.messageOwner.id = message_id
+        self.messageOwner.media = media
+        self.payload = bytearray(payload_bytes)
+
+
+def photo_message(message_id=42, photo_id=5555, file_reference=b"\x01ref", payload_bytes=0):
+    photo = TLRPC.TL_photo()
+    photo.id = photo_id
+    photo.access_hash = 99
+    photo.file_reference = bytearray(file_reference)
+    media = TLRPC.TL_messageMediaPhoto()
+    media.photo = photo
+    return MessageObject(message_id, media, payload_bytes)
+
+
+def document_message(message_id=43, document_id=6666, file_reference=b"\x02ref", payload_bytes=0):
+    document = TLRPC.TL_document()
+    document.id = document_id
+    document.access_hash = 98
+    document.file_reference = bytearray(file_reference)
+    media = TLRPC.TL_messageMediaDocument()
+    media.document = document
+    return MessageObject(message_id, media, payload_bytes)
+
+
+def entities(*spans):
+    """Builds an entity ArrayList from ``(cls_name, offset, length)`` tuples."""
+    result = ArrayList()
+    for cls_name, offset, length in spans:
+        entity = getattr(TLRPC, cls_name)()
+        entity.offset = offset
+        entity.length = length
+        result.add(entity)
+    return result
+
+
+def load_plugin_module(path=None):
+    """Returns the working tree's repeater_pro, or the plugin file at ``path`` to compare versions."""
+    if not path:
+        import repeater_pro
+        return repeater_pro
+    spec = importlib.util.spec_from_file_location("repeater_pro_under_test", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_plugin(settings=None, module=None):
+    """Creates and loads a SpammerPlugin with the given setting overrides."""
+    plugin = (module or load_plugin_module()).SpammerPlugin()
+    plugin.settings_store.update(settings or {})
+    plugin.on_plugin_load()
+    return plugin
+
+
+def reset_loopers():
+    """Drops every pending runnable on the main, worker and network loopers."""
+    for looper in Looper.instances:
+        looper.clear()
+
+
+def run_loopers_until_idle(max_uptime=None):
+    """
+    Runs the runnables of every looper in global due-time order, the way the
+    main thread, the task thread and the network thread would interleave, until
+    nothing is pending or the next runnable is due after ``max_uptime``.
+    """
+    events = 0
+    while True:
+        pending = [looper for looper in Looper.instances if looper.queue]
+        if not pending:
+            return events
+        looper = min(pending, key=Looper.next_uptime)
+        if max_uptime is not None and looper.next_uptime() > max_uptime:
+            return events
+        looper.run_one()
+        events += 1
+
+
+class _Delivery:
+    """Runnable delivering one response on the network looper, standing in for the network thread."""
+    def __init__(self, callback, response, error):
+        self.callback = callback
+        self.response = response
+        self.error = error
+
+    def run(self):
+        self.callback.run(self.response, self.error)
+
+
+class EchoNetwork:
+    """Acknowledges every send request on its own network looper after a fixed round trip."""
+    def __init__(self, rtt_ms=0):
+        from android.os import Handler
+        self.rtt_ms = rtt_ms
+        self.handler = Handler(Looper("network"))
+        self.sent = []
+        self.next_message_id = 1000
+        self.tl_objects = 0  # TL objects this model created for responses
+
+    def send_request(self, request, callback):
+        from org.telegram.tgnet import TLObject
+        self.sent.append(request)
+        created_before = TLObject.created
+        response = None
+        if hasattr(request, "random_id") and callback is not None:
+            self.next_message_id += 1
+            response = TLRPC.TL_updates()
+            update = TLRPC.TL_updateMessageID()
+            update.id = self.next_message_id
+            update.random_id = request.random_id
+            response.updates.add(update)
+        self.tl_objects += TLObject.created - created_before
+        if callback is not None:
+            self.handler.postDelayed(_Delivery(callback, response, None), self.rtt_ms)
+        return len(self.sent)
+
+    def cancel_request(self, token, notify_server=True):
+        pass
@@ -0,0 +1,351 @@
+"""
+Discrete-event simulator for whole spam tasks.
+
+Runs the real SpammerPlugin against the offline stubs on a virtual clock: every
+Handler post, network round trip and deletion happens in simulated time, so a
+500-message run with a 1.5 s delay finishes in milliseconds of wall time. The
+network model draws round-trip times from a configurable distribution and can
+inject FLOOD_WAIT errors from a server-side token bucket, random errors, and
+file references that expire every N media sends. With --stop-after-ms the stop
+command is sent mid-task, and the report shows what cancellation left behind.
+
+    python bench/simulator.py --command ".spamdel Load test [500] [0.1]" --rtt normal:80:25
+    python bench/simulator.py --flood-rate 20 --flood-burst 30 --flood-wait 5 --json
+    python bench/simulator.py --command ".spam [300] [0.2]" --media --file-ref-ttl 100
+    python bench/simulator.py --command ".spamdel Load test [500] [0.1]" --stop-after-ms 20000
+    python bench/simulator.py --plugin /tmp/repeater_pro_old.py   # compare another version
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+
+import fixtures
+from fixtures import SendMessageParams, photo_message
+
+from android.os import Handler, Looper, SystemClock
+from client_utils import get_messages_controller, set_network
+from org.telegram.tgnet import TLRPC
+
+
+class RttModel:
+    """Round-trip time distribution: fixed:MS, uniform:LOW:HIGH, normal:MEAN:STDDEV or exp:MEAN."""
+    def __init__(self, spec, rng):
+        kind, *values = spec.split(":")
+        self.kind = kind
+        self.values = [float(value) for value in values]
+        self.rng = rng
+        if kind not in ("fixed", "uniform", "normal", "exp"):
+            raise ValueError(f"Unknown RTT distribution {spec!r}")
+
+    def sample(self):
+        if self.kind == "fixed":
+            value = self.values[0]
+        elif self.kind == "uniform":
+            value = self.rng.uniform(self.values[0], self.values[1])
+        elif self.kind == "normal":
+            value = self.rng.gauss(self.values[0], self.values[1])
+        else:
+            value = self.rng.expovariate(1 / self.values[0])
+        return max(1, int(value))
+
+
+class _Delivery:
+    """Runnable that delivers one response when its round trip is over, unless its request was cancelled."""
+    def __init__(self, network, callback, response, error, random_id):
+        self.network = network
+        self.callback = callback
+        self.response = response
+        self.error = error
+        self.random_id = random_id
+        self.token = len(network.sent)
+
+    def run(self):
+        if self.token in self.network.cancelled:
+            self.network.dropped_deliveries += 1
+            return
+        if self.random_id is not None and self.error is None:
+            self.network.acked_at[self.random_id] = SystemClock.uptimeMillis()
+        if self.callback is not None:
+            self.callback.run(self.response, self.error)
+
+
+class SimulatedNetwork:
+    """
+    Answers send requests after a sampled RTT on its own looper.
+
+    The flood model is a token bucket on the "server": while it has tokens a
+    request succeeds; when it runs dry the server replies FLOOD_WAIT_<wait> and
+    keeps rejecting requests until the wait is over.
+
+    With a file reference TTL, media sends must carry the current reference,
+    which changes every `file_ref_ttl` accepted media sends; getMessages returns
+    the source message with the current one.
+    """
+    def __init__(self, rtt, rng, flood_rate=0.0, flood_burst=0, flood_wait=5, error_rate=0.0, error_text="INTERNAL_SERVER_ERROR",
+                 file_ref_ttl=0):
+        from android.os import Handler
+        self.rtt = rtt
+        self.rng = rng
+        self.handler = Handler(Looper("network"))
+        self.flood_rate = flood_rate
+        self.flood_burst = flood_burst or max(1, int(flood_rate))
+        self.flood_wait = flood_wait
+        self.tokens = float(self.flood_burst)
+        self.refilled_at = None
+        self.penalty_until = 0
+        self.error_rate = error_rate
+        self.error_text = error_text
+        self.file_ref_ttl = file_ref_ttl
+        self.valid_reference = None  # Adopted from the first media send carrying a reference
+        self.media_accepted = 0
+        self.last_media = None
+        self.refetches = 0
+        self.sent = []
+        self.send_times = []  # Uptime of every accepted send
+        self.acked_at = {}  # random_id -> uptime its acknowledgement was delivered
+        self.message_ids = {}  # message id -> random_id
+        self.errors = {}
+        self.cancelled = set()  # Tokens of requests cancelled by the client
+        self.dropped_deliveries = 0
+        self.next_message_id = 1
+
+    def _file_reference_error(self, request):
+        media = getattr(request, "media", None)
+        if not self.file_ref_ttl or media is None:
+            return None
+        self.last_media = media
+        reference = bytes(media.id.file_reference or b"")
+        if not reference:
+            return "FILE_REFERENCE_EMPTY"
+        if self.valid_reference is None:
+            self.valid_reference = reference
+        if reference != self.valid_reference:
+            return "FILE_REFERENCE_EXPIRED"
+        self.media_accepted += 1
+        if self.media_accepted % self.file_ref_ttl == 0:
+            self.valid_reference = b"ref-%d" % self.media_accepted
+        return None
+
+    def _refetch_response(self, request):
+        """messages.getMessages / channels.getMessages: the source message with the current reference."""
+        self.refetches += 1
+        message = TLRPC.TL_message()
+        message.id = request.id.get(0).id
+        if self.last_media is not None:
+            is_photo = isinstance(self.last_media, TLRPC.TL_inputMediaPhoto)
+            file = TLRPC.TL_photo() if is_photo else TLRPC.TL_document()
+            file.id = self.last_media.id.id
+            file.access_hash = self.last_media.id.access_hash
+            file.file_reference = bytearray(self.valid_reference or b"ref-0")
+            message.media = TLRPC.TL_messageMediaPhoto() if is_photo else TLRPC.TL_messageMediaDocument()
+            if is_photo:
+                message.media.photo = file
+            else:
+                message.media.document = file
+        response = TLRPC.TL_messages_messages()
+        response.messages.add(message)
+        return response
+
+    def _server_error(self, request, now):
+        file_reference_error = self._file_reference_error(request)
+        if file_reference_error:
+            return file_reference_error
+        if self.flood_rate > 0:
+            if now < self.penalty_until:
+                return f"FLOOD_WAIT_{math.ceil((self.penalty_until - now) / 1000)}"
+            if self.refilled_at is not None:
+                self.tokens = min(self.flood_burst, self.tokens + (now - self.refilled_at) * self.flood_rate / 1000)
+            self.refilled_at = now
+            if self.tokens < 1:
+                self.penalty_until = now + self.flood_wait * 1000
+                return f"FLOOD_WAIT_{self.flood_wait}"
+            self.tokens -= 1
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return self.error_text
+        return None
+
+    def send_request(self, request, callback):
+        now = SystemClock.uptimeMillis()
+        self.sent.append(request)
+        rtt = self.rtt.sample()
+        if isinstance(request, (TLRPC.TL_messages_getMessages, TLRPC.TL_channels_getMessages)):
+            self.handler.postDelayed(_Delivery(self, callback, self._refetch_response(request), None, None), rtt)
+            return len(self.sent)
+        # The server decides when the request arrives, half a round trip later
+        error_text = self._server_error(request, now + rtt // 2)
+        random_id = getattr(request, "random_id", None)
+        if error_text:
+            self.errors[error_text] = self.errors.get(error_text, 0) + 1
+            error = TLRPC.TL_error()
+            error.text = error_text
+            self.handler.postDelayed(_Delivery(self, callback, None, error, None), rtt)
+        else:
+            self.send_times.append(now)
+            response = TLRPC.TL_updates()
+            update = TLRPC.TL_updateMessageID()
+            update.id = self.next_message_id
+            update.random_id = random_id
+            response.updates.add(update)
+            self.message_ids[self.next_message_id] = random_id
+            self.next_message_id += 1
+            self.handler.postDelayed(_Delivery(self, callback, response, None, random_id), rtt)
+        return len(self.sent)
+
+    def cancel_request(self, token, notify_server=True):
+        self.cancelled.add(token)
+
+
+class _StopCommand:
+    """Runnable sending the stop command through the hook, as the user would mid-task."""
+    def __init__(self, plugin, command):
+        self.plugin = plugin
+        self.command = command
+        self.sent_at = None
+        self.wall_ms = 0.0
+
+    def run(self):
+        self.sent_at = SystemClock.uptimeMillis()
+        started = time.perf_counter()
+        self.plugin.on_send_message_hook(0, SendMessageParams(self.command))
+        self.wall_ms = (time.perf_counter() - started) * 1000
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def simulate(args):
+    rng = random.Random(args.seed)
+    SystemClock.use_virtual_time(0)
+    Looper.getMainLooper()  # Always reported, even when the plugin never posts to it
+    fixtures.reset_loopers()
+    for looper in Looper.instances:
+        looper.reset_counters()
+    get_messages_controller().deleted.clear()
+    network = SimulatedNetwork(RttModel(args.rtt, rng), rng, args.flood_rate, args.flood_burst,
+                               args.flood_wait, args.error_rate, args.error_text, args.file_ref_ttl)
+    previous = set_network(network)
+    try:
+        module = fixtures.load_plugin_module(args.plugin)
+        plugin = module.SpammerPlugin()
+        plugin.settings_store.update({"confirmation_threshold": 10 ** 9, "max_spam_limit": 10 ** 6})
+        for item in args.setting or []:
+            key, _, value = item.partition("=")
+            plugin.settings_store[key] = value
+        plugin.on_plugin_load()
+
+        reply = photo_message(file_reference=b"" if args.expired_media else b"\x01ref") if args.media else None
+        started_wall = time.perf_counter()
+        plugin.on_send_message_hook(0, SendMessageParams(args.command, reply_to=reply))
+        stop = None
+        if args.stop_after_ms is not None:
+            stop = _StopCommand(plugin, args.stop_command)
+            Handler(Looper.getMainLooper()).postAtTime(stop, args.stop_after_ms)
+        events = fixtures.run_loopers_until_idle(args.max_seconds * 1000)
+        wall_ms = (time.perf_counter() - started_wall) * 1000
+        # Work each thread did during the run; what lands on "main" competes with frame rendering
+        threads = {looper.name: {"runnables": looper.executed, "busy_ms": looper.busy_ns / 1e6, "longest_us": looper.longest_ns / 1e3}
+                   for looper in Looper.instances}
+        stats = getattr(plugin, "last_task_stats", None)
+        plugin_summary = stats.summary() if stats is not None else None
+        plugin.on_plugin_unload()
+    finally:
+        network.handler.getLooper().quit()
+        set_network(previous)
+        end_uptime = SystemClock.uptimeMillis()
+        SystemClock.use_real_time()
+
+    sends = network.send_times
+    intervals = sorted(b - a for a, b in zip(sends, sends[1:]))
+    deletes = get_messages_controller().deleted
+    delete_delays = []
+    for ids, _, deleted_at in deletes:
+        for message_id in ids:
+            acked = network.acked_at.get(network.message_ids.get(int(message_id)))
+            if acked is not None:
+                delete_delays.append(deleted_at - acked)
+    delete_delays.sort()
+    after_stop = [] if stop is None or stop.sent_at is None else [
+        uptime for uptime in [*sends, *(deleted_at for _, _, deleted_at in deletes)] if uptime > stop.sent_at]
+    return {
+        "command": args.command,
+        "requests": len(network.sent),
+        "refetches": network.refetches,
+        "accepted_sends": len(sends),
+        "errors": network.errors,
+        "virtual_duration_ms": (sends[-1] - sends[0]) if len(sends) > 1 else 0,
+        "virtual_end_ms": end_uptime,
+        "interval_mean_ms": (sum(intervals) / len(intervals)) if intervals else 0,
+        "interval_p50_ms": _percentile(intervals, 0.50),
+        "interval_p99_ms": _percentile(intervals, 0.99),
+        "deleted_messages": len(delete_delays),
+        "delete_requests": len(deletes),
+        "delete_delay_p50_ms": _percentile(delete_delays, 0.50),
+        "delete_delay_p99_ms": _percentile(delete_delays, 0.99),
+        "events": events,
+        "threads": threads,
+        "wall_ms": wall_ms,
+        "plugin_stats": plugin_summary,
+        "stop_at_ms": stop.sent_at if stop is not None else None,
+        "stop_wall_ms": stop.wall_ms if stop is not None else None,
+        "cancelled_requests": len(network.cancelled),
+        "dropped_deliveries": network.dropped_deliveries,
+        "activity_after_stop": len(after_stop),
+        "last_activity_after_stop_ms": (max(after_stop) - stop.sent_at) if after_stop else 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--command", default=".spam Load test [500] [0.1]", help="Command sent through the hook.")
+    parser.add_argument("--media", action="store_true", help="Send the command as a reply to a photo.")
+    parser.add_argument("--expired-media", action="store_true", help="With --media, the photo carries no file reference.")
+    parser.add_argument("--file-ref-ttl", type=int, default=0, help="Media sends accepted before the file reference changes (0 = never).")
+    parser.add_argument("--rtt", default="normal:80:25", help="RTT distribution: fixed:MS, uniform:LOW:HIGH, normal:MEAN:SD, exp:MEAN.")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Server budget in requests/s (0 disables the flood model).")
+    parser.add_argument("--flood-burst", type=int, default=0, help="Server bucket size (defaults to one second of budget).")
+    parser.add_argument("--flood-wait", type=int, default=5, help="Seconds in the FLOOD_WAIT the server imposes when the bucket runs dry.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected error per request.")
+    parser.add_argument("--error-text", default="INTERNAL_SERVER_ERROR")
+    parser.add_argument("--setting", action="append", metavar="KEY=VALUE", help="Plugin setting override (repeatable).")
+    parser.add_argument("--plugin", help="Path of another repeater_pro.py to simulate instead of the working tree.")
+    parser.add_argument("--stop-after-ms", type=int, help="Virtual uptime at which the stop command is sent.")
+    parser.add_argument("--stop-command", default=".spamstop", help="Command sent by --stop-after-ms.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-seconds", type=int, default=24 * 3600, help="Virtual time limit.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    report = simulate(args)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return 0
+    print(f"command            {report['command']}")
+    print(f"requests           {report['requests']} ({report['accepted_sends']} accepted, errors: {report['errors'] or 'none'})")
+    if report["refetches"]:
+        print(f"message re-fetches {report['refetches']}")
+    print(f"virtual duration   {report['virtual_duration_ms'] / 1000:.2f} s from first to last accepted send")
+    print(f"send interval      mean {report['interval_mean_ms']:.1f} ms, p50 {report['interval_p50_ms']} ms, p99 {report['interval_p99_ms']} ms")
+    if report["delete_requests"]:
+        print(f"deletions          {report['deleted_messages']} messages in {report['delete_requests']} requests, "
+              f"ack->delete p50 {report['delete_delay_p50_ms']} ms, p99 {report['delete_delay_p99_ms']} ms")
+    if report["stop_at_ms"] is not None:
+        print(f"stop               sent at {report['stop_at_ms']} ms, hook took {report['stop_wall_ms']:.2f} ms wall time; "
+              f"{report['cancelled_requests']} request(s) cancelled, {report['dropped_deliveries']} response(s) dropped")
+        print(f"after stop         {report['activity_after_stop']} send/delete request(s), "
+              f"last {report['last_activity_after_stop_ms']} ms after the stop")
+    print(f"simulation         {report['events']} events in {report['wall_ms']:.1f} ms wall time")
+    for name, work in report["threads"].items():
+        print(f"  {name + ' thread':<28}{work['runnables']:>6} runnables, {work['busy_ms']:.1f} ms busy, longest {work['longest_us']:.0f} us")
+    if report["plugin_stats"]:
+        print("\nplugin stats\n  " + report["plugin_stats"].replace("\n", "\n  "))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+"""Offline stand-in for ``android.content``."""
+
+
+class Context:
+    CLIPBOARD_SERVICE = "clipboard"
+
+
+class ClipData:
+    def __init__(self, label, text):
+        self.label = label
+        self.text = text
+
+    @staticmethod
+    def newPlainText(label, text):
+        return ClipData(label, text)
+
+
+class ClipboardManager:
+    def __init__(self):
+        self.primary_clip = None
+
+    def setPrimaryClip(self, clip):
+        self.primary_clip = clip
@@ -0,0 +1,163 @@
+"""
+Offline stand-in for ``android.os``.
+
+Loopers keep their pending runnables in a heap ordered by uptime. Nothing runs
+by itself: callers drain a looper explicitly with ``run_pending`` or
+``run_until_idle``. ``SystemClock`` reads the real monotonic clock unless a
+virtual time has been set, in which case draining a looper advances it.
+"""
+import heapq
+import itertools
+import time
+
+
+class SystemClock:
+    _virtual_ms = None
+
+    @staticmethod
+    def uptimeMillis():
+        if SystemClock._virtual_ms is not None:
+            return SystemClock._virtual_ms
+        return int(time.monotonic() * 1000)
+
+    @staticmethod
+    def elapsedRealtime():
+        return SystemClock.uptimeMillis()
+
+    @staticmethod
+    def use_virtual_time(start_ms=0):
+        SystemClock._virtual_ms = int(start_ms)
+
+    @staticmethod
+    def use_real_time():
+        SystemClock._virtual_ms = None
+
+    @staticmethod
+    def is_virtual():
+        return SystemClock._virtual_ms is not None
+
+
+class Looper:
+    _main = None
+    _sequence = itertools.count()
+    instances = []  # Every looper created, so simulators can drain them in time order
+
+    def __init__(self, name="main"):
+        self.name = name
+        self.queue = []
+        self.executed = 0
+        self.busy_ns = 0  # Wall time spent running this looper's runnables
+        self.longest_ns = 0
+        Looper.instances.append(self)
+
+    @staticmethod
+    def getMainLooper():
+        if Looper._main is None:
+            Looper._main = Looper("main")
+        return Looper._main
+
+    @staticmethod
+    def myLooper():
+        return Looper.getMainLooper()
+
+    def enqueue(self, runnable, uptime_ms):
+        heapq.heappush(self.queue, (uptime_ms, next(Looper._sequence), runnable))
+        return True
+
+    def remove(self, runnable):
+        before = len(self.queue)
+        self.queue = [entry for entry in self.queue if entry[2] is not runnable]
+        heapq.heapify(self.queue)
+        return before - len(self.queue)
+
+    def clear(self):
+        self.queue.clear()
+
+    def next_uptime(self):
+        return self.queue[0][0] if self.queue else None
+
+    def run_one(self):
+        """Runs the earliest pending runnable, advancing virtual time to its due time."""
+        when, _, runnable = heapq.heappop(self.queue)
+        if SystemClock.is_virtual() and when > SystemClock._virtual_ms:
+            SystemClock._virtual_ms = when
+        self.executed += 1
+        started = time.perf_counter_ns()
+        try:
+            runnable.run()
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            self.busy_ns += elapsed
+            self.longest_ns = max(self.longest_ns, elapsed)
+
+    def reset_counters(self):
+        self.executed = self.busy_ns = self.longest_ns = 0
+
+    def run_pending(self):
+        """Runs every runnable that is already due, including ones they post for now."""
+        ran = 0
+        while self.queue and self.queue[0][0] <= SystemClock.uptimeMillis():
+            self.run_one()
+            ran += 1
+        return ran
+
+    def run_until_idle(self, limit=1_000_000):
+        """Runs everything in due order regardless of the clock (meant for virtual time)."""
+        ran = 0
+        while self.queue and ran < limit:
+            self.run_one()
+            ran += 1
+        return ran
+
+    def quit(self):
+        self.queue.clear()
+        if self is not Looper._main and self in Looper.instances:
+            Looper.instances.remove(self)
+
+    quitSafely = quit
+
+
+class Handler:
+    def __init__(self, looper=None, callback=None):
+        self.looper = looper if looper is not None else Looper.myLooper()
+
+    def getLooper(self):
+        return self.looper
+
+    def post(self, runnable):
+        return self.looper.enqueue(runnable, SystemClock.uptimeMillis())
+
+    def postDelayed(self, runnable, delay_ms):
+        return self.looper.enqueue(runnable, SystemClock.uptimeMillis() + max(0, int(delay_ms)))
+
+    def postAtTime(self, runnable, uptime_ms):
+        return self.looper.enqueue(runnable, int(uptime_ms))
+
+    def removeCallbacks(self, runnable):
+        self.looper.remove(runnable)
+
+    def removeCallbacksAndMessages(self, token=None):
+        self.looper.clear()
+
+
+class HandlerThread:
+    """A worker whose looper is drained by the caller like any other stub looper."""
+    def __init__(self, name, priority=0):
+        self.name = name
+        self.looper = None
+
+    def start(self):
+        self.looper = Looper(self.name)
+
+    def getLooper(self):
+        return self.looper
+
+    def quit(self):
+        if self.looper:
+            self.looper.quit()
+        return True
+
+    quitSafely = quit
+
+    def isAlive(self):
+        return self.looper is not None
@@ -0,0 +1,16 @@
+"""Offline stand-in for ``android.widget``."""
+
+
+class Toast:
+    LENGTH_SHORT = 0
+    LENGTH_LONG = 1
+
+    def __init__(self, text):
+        self.text = text
+
+    @staticmethod
+    def makeText(context, text, duration):
+        return Toast(text)
+
+    def show(self):
+        pass
@@ -0,0 +1,14 @@
+"""Offline stand-in for the exteraGram ``android_utils`` module."""
+
+# Every callable handed to run_on_ui_thread, in order, for inspection by benchmarks
+ui_calls = []
+
+
+def log(data):
+    pass
+
+
+def run_on_ui_thread(func, delay=0):
+    """Runs the callable immediately; there is no separate UI thread offline."""
+    ui_calls.append(func)
+    func()
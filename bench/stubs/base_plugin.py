@@ -0,0 +1,51 @@
+"""Offline stand-in for the exteraGram ``base_plugin`` module."""
+
+
+class HookStrategy:
+    """Mirrors the strategies a send-message hook can return."""
+    DEFAULT = "DEFAULT"
+    CANCEL = "CANCEL"
+    MODIFY = "MODIFY"
+    MODIFY_FINAL = "MODIFY_FINAL"
+
+
+class HookResult:
+    """Result object returned by plugin hooks."""
+    def __init__(self, strategy=HookStrategy.DEFAULT, params=None, request=None, response=None, update=None, updates=None):
+        self.strategy = strategy
+        self.params = params
+        self.request = request
+        self.response = response
+        self.update = update
+        self.updates = updates
+
+
+class BasePlugin:
+    """Minimal plugin base class backed by an in-memory settings dict."""
+    def __init__(self):
+        self.settings_store = {}
+        self.registered_hooks = []
+
+    def get_setting(self, key, default=None):
+        return self.settings_store.get(key, default)
+
+    def set_setting(self, key, value, reload_settings=False):
+        self.settings_store[key] = value
+
+    def add_on_send_message_hook(self, priority=0):
+        self.registered_hooks.append(("on_send_message", priority))
+
+    def add_hook(self, name, match_substring=False, priority=0):
+        self.registered_hooks.append((name, priority))
+
+    def log(self, message):
+        pass
+
+    def on_plugin_load(self):
+        pass
+
+    def on_plugin_unload(self):
+        pass
+
+    def create_settings(self):
+        return []
@@ -0,0 +1,140 @@
+"""
+Offline stand-in for the exteraGram ``client_utils`` module.
+
+``send_request`` hands every request to the active network model. The default
+``NullNetwork`` records the request and never answers, which is what the hook
+benchmarks want; simulators install their own model with ``set_network``.
+"""
+import itertools
+
+from android.os import SystemClock
+from java.chaquopy import dynamic_proxy
+from org.telegram.messenger import ChatObject
+from org.telegram.tgnet import TLRPC
+
+
+class RequestDelegate:
+    """Marker for the org.telegram.tgnet.RequestDelegate interface."""
+
+
+class RequestCallback(dynamic_proxy(RequestDelegate)):
+    """Wraps a Python callable the way the client's RequestDelegate proxy does."""
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+
+    def run(self, response, error):
+        self.fn(response, error)
+
+
+class NullNetwork:
+    def __init__(self):
+        self.sent = []
+        self._tokens = itertools.count(1)
+
+    def send_request(self, request, callback):
+        self.sent.append(request)
+        return next(self._tokens)
+
+    def cancel_request(self, token, notify_server=True):
+        pass
+
+
+_network = NullNetwork()
+
+
+def set_network(network):
+    global _network
+    previous, _network = _network, network
+    return previous
+
+
+def get_network():
+    return _network
+
+
+def send_request(request, callback):
+    return _network.send_request(request, callback)
+
+
+def send_message(params):
+    _network.sent.append(params)
+
+
+class ConnectionsManager:
+    def cancelRequest(self, token, notify_server):
+        _network.cancel_request(token, notify_server)
+
+
+class MessagesController:
+    """
+    Resolves peers the way the client does: a dialog id is a user id (>0) or the
+    negated id of a chat (<0), which is a channel if its known Chat object says so.
+    """
+    def __init__(self):
+        self.deleted = []
+        self.chats = {}  # chat id -> TLRPC.Chat
+
+    def putChat(self, chat, from_cache=False):
+        self.chats[chat.id] = chat
+
+    def getChat(self, chat_id):
+        return self.chats.get(int(chat_id))
+
+    def getInputPeer(self, dialog_id):
+        dialog_id = int(dialog_id)
+        if dialog_id > 0:
+            peer = TLRPC.TL_inputPeerUser()
+            peer.user_id = dialog_id
+            return peer
+        chat = self.getChat(-dialog_id)
+        if ChatObject.isChannel(chat):
+            peer = TLRPC.TL_inputPeerChannel()
+            peer.channel_id = chat.id
+            peer.access_hash = chat.access_hash
+        else:
+            peer = TLRPC.TL_inputPeerChat()
+            peer.chat_id = -dialog_id
+        return peer
+
+    def getInputChannel(self, channel_id):
+        channel = TLRPC.TL_inputChannel()
+        channel.channel_id = int(channel_id)
+        chat = self.getChat(channel_id)
+        if chat is not None:
+            channel.access_hash = chat.access_hash
+        return channel
+
+    def deleteMessages(self, messages, randoms, encrypted_chat, dialog_id, *rest):
+        self.deleted.append((list(messages), dialog_id, SystemClock.uptimeMillis()))
+
+
+class Activity:
+    def getSystemService(self, name):
+        from android.content import ClipboardManager
+        return ClipboardManager()
+
+
+class Fragment:
+    def __init__(self):
+        self.activity = Activity()
+
+    def getParentActivity(self):
+        return self.activity
+
+
+_messages_controller = MessagesController()
+_connections_manager = ConnectionsManager()
+_fragment = Fragment()
+
+
+def get_messages_controller():
+    return _messages_controller
+
+
+def get_connections_manager():
+    return _connections_manager
+
+
+def get_last_fragment():
+    return _fragment
@@ -0,0 +1,27 @@
+"""Offline stand-in for ``java.chaquopy``."""
+
+_proxy_bases = {}
+
+
+class ProxyObject:
+    """Base of every stub proxy; counts instances since creating proxies is costly on device."""
+    created = 0
+
+    def __init__(self, *args, **kwargs):
+        ProxyObject.created += 1
+
+
+def dynamic_proxy(*interfaces):
+    """Returns a plain Python base class standing in for a Chaquopy proxy of the interfaces."""
+    base = _proxy_bases.get(interfaces)
+    if base is None:
+        base = type("DynamicProxy", (ProxyObject,) + interfaces, {})
+        _proxy_bases[interfaces] = base
+    return base
+
+
+static_proxy = dynamic_proxy
+
+
+def jclass(name):
+    raise NotImplementedError(f"jclass({name!r}) is not available offline")
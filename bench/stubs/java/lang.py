@@ -0,0 +1,9 @@
+"""Offline stand-in for ``java.lang``."""
+
+
+class Runnable:
+    """Marker for the java.lang.Runnable interface."""
+
+
+class Integer(int):
+    """Boxed java.lang.Integer; behaves like a Python int."""
@@ -0,0 +1,30 @@
+"""Offline stand-in for ``java.util``."""
+
+
+class ArrayList(list):
+    """java.util.ArrayList on top of a Python list."""
+
+    def add(self, item):
+        self.append(item)
+        return True
+
+    def addAll(self, items):
+        self.extend(items)
+        return True
+
+    def get(self, index):
+        return self[index]
+
+    def set(self, index, item):
+        previous = self[index]
+        self[index] = item
+        return previous
+
+    def size(self):
+        return len(self)
+
+    def isEmpty(self):
+        return not self
+
+    def contains(self, item):
+        return item in self
@@ -0,0 +1,12 @@
+"""Offline stand-in for the exteraGram ``markdown_utils`` module."""
+
+
+class ParsedText:
+    def __init__(self, text, entities):
+        self.text = text
+        self.entities = entities
+
+
+def parse_markdown(text):
+    """Returns the text unchanged; formatting is irrelevant offline."""
+    return ParsedText(text, [])
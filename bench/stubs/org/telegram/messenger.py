@@ -0,0 +1,9 @@
+"""Offline stand-in for ``org.telegram.messenger``."""
+from org.telegram.tgnet import TLRPC
+
+
+class ChatObject:
+    @staticmethod
+    def isChannel(chat):
+        """Channels and supergroups, as opposed to basic groups."""
+        return isinstance(chat, (TLRPC.TL_channel, TLRPC.TL_channelForbidden))
@@ -0,0 +1,92 @@
+"""
+Offline stand-in for ``org.telegram.tgnet``.
+
+Only the TLRPC classes the plugin touches are modelled. Every constructor bumps
+``TLObject.created`` so benchmarks can count Java objects allocated per send.
+"""
+from java.util import ArrayList
+
+
+class TLObject:
+    created = 0
+    _defaults = {}
+
+    def __init__(self):
+        TLObject.created += 1
+        for name, value in self._defaults.items():
+            setattr(self, name, value() if callable(value) else value)
+
+
+def _tl(name, base=TLObject, **defaults):
+    merged = dict(getattr(base, "_defaults", {}))
+    merged.update(defaults)
+    return type(name, (base,), {"_defaults": merged})
+
+
+class TLRPC:
+    TL_error = _tl("TL_error", code=0, text=None)
+
+    # Peers
+    InputPeer = _tl("InputPeer")
+    TL_inputPeerEmpty = _tl("TL_inputPeerEmpty", InputPeer)
+    TL_inputPeerSelf = _tl("TL_inputPeerSelf", InputPeer)
+    TL_inputPeerUser = _tl("TL_inputPeerUser", InputPeer, user_id=0, access_hash=0)
+    TL_inputPeerChat = _tl("TL_inputPeerChat", InputPeer, chat_id=0)
+    TL_inputPeerChannel = _tl("TL_inputPeerChannel", InputPeer, channel_id=0, access_hash=0)
+    TL_inputChannel = _tl("TL_inputChannel", channel_id=0, access_hash=0)
+
+    # Chats
+    Chat = _tl("Chat", id=0, title="")
+    TL_chat = _tl("TL_chat", Chat)
+    TL_channel = _tl("TL_channel", Chat, access_hash=0, megagroup=False)
+    TL_channelForbidden = _tl("TL_channelForbidden", Chat, access_hash=0)
+
+    # Outgoing requests
+    TL_inputReplyToMessage = _tl("TL_inputReplyToMessage", flags=0, reply_to_msg_id=0, top_msg_id=0)
+    TL_messages_sendMessage = _tl(
+        "TL_messages_sendMessage", flags=0, peer=None, reply_to=None, message="",
+        random_id=0, entities=ArrayList, no_webpage=False, silent=False,
+    )
+    TL_messages_sendMedia = _tl(
+        "TL_messages_sendMedia", flags=0, peer=None, reply_to=None, media=None, message="",
+        random_id=0, entities=ArrayList, silent=False,
+    )
+    TL_inputMessageID = _tl("TL_inputMessageID", id=0)
+    TL_messages_getMessages = _tl("TL_messages_getMessages", id=ArrayList)
+    TL_channels_getMessages = _tl("TL_channels_getMessages", channel=None, id=ArrayList)
+
+    # Input media
+    InputMedia = _tl("InputMedia", flags=0)
+    TL_inputPhoto = _tl("TL_inputPhoto", id=0, access_hash=0, file_reference=None)
+    TL_inputDocument = _tl("TL_inputDocument", id=0, access_hash=0, file_reference=None)
+    TL_inputMediaPhoto = _tl("TL_inputMediaPhoto", InputMedia, id=None, spoiler=False)
+    TL_inputMediaDocument = _tl("TL_inputMediaDocument", InputMedia, id=None, spoiler=False, query=None)
+
+    # Message media
+    TL_photo = _tl("TL_photo", id=0, access_hash=0, file_reference=None, sizes=ArrayList)
+    TL_photoEmpty = _tl("TL_photoEmpty", id=0)
+    TL_document = _tl("TL_document", id=0, access_hash=0, file_reference=None, mime_type="", size=0, thumbs=ArrayList)
+    TL_documentEmpty = _tl("TL_documentEmpty", id=0)
+    MessageMedia = _tl("MessageMedia")
+    TL_messageMediaEmpty = _tl("TL_messageMediaEmpty", MessageMedia)
+    TL_messageMediaPhoto = _tl("TL_messageMediaPhoto", MessageMedia, photo=None)
+    TL_messageMediaDocument = _tl("TL_messageMediaDocument", MessageMedia, document=None)
+
+    # Messages and entities
+    TL_message = _tl("TL_message", id=0, message="", media=None, peer_id=None, entities=ArrayList)
+    MessageEntity = _tl("MessageEntity", offset=0, length=0)
+    TL_messageEntityBold = _tl("TL_messageEntityBold", MessageEntity)
+    TL_messageEntityItalic = _tl("TL_messageEntityItalic", MessageEntity)
+    TL_messageEntityCode = _tl("TL_messageEntityCode", MessageEntity)
+    TL_messageEntityPre = _tl("TL_messageEntityPre", MessageEntity, language="")
+    TL_messageEntityTextUrl = _tl("TL_messageEntityTextUrl", MessageEntity, url="")
+
+    # Updates
+    Updates = _tl("Updates")
+    TL_updateShortSentMessage = _tl("TL_updateShortSentMessage", Updates, id=0, pts=0, date=0)
+    TL_updates = _tl("TL_updates", Updates, updates=ArrayList, users=ArrayList, chats=ArrayList)
+    TL_updateMessageID = _tl("TL_updateMessageID", id=0, random_id=0)
+    TL_updateNewMessage = _tl("TL_updateNewMessage", message=None)
+    TL_updateNewChannelMessage = _tl("TL_updateNewChannelMessage", message=None)
+    TL_messages_messages = _tl("TL_messages_messages", messages=ArrayList)
+    TL_messages_channelMessages = _tl("TL_messages_channelMessages", messages=ArrayList)
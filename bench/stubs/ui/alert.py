@@ -0,0 +1,35 @@
+"""Offline stand-in for ``ui.alert``."""
+
+
+class AlertDialogBuilder:
+    """Records the dialog contents instead of displaying them."""
+    shown = []
+
+    def __init__(self, activity, progress_style=0):
+        self.activity = activity
+        self.title = None
+        self.message = None
+        self.buttons = {}
+
+    def set_title(self, title):
+        self.title = title
+        return self
+
+    def set_message(self, message):
+        self.message = message
+        return self
+
+    def set_positive_button(self, text, listener=None):
+        self.buttons["positive"] = (text, listener)
+        return self
+
+    def set_negative_button(self, text, listener=None):
+        self.buttons["negative"] = (text, listener)
+        return self
+
+    def show(self):
+        AlertDialogBuilder.shown.append(self)
+        return self
+
+    def dismiss(self):
+        pass
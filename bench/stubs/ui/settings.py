@@ -0,0 +1,30 @@
+"""Offline stand-in for ``ui.settings``."""
+
+
+class _SettingItem:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Header(_SettingItem):
+    pass
+
+
+class Text(_SettingItem):
+    pass
+
+
+class Input(_SettingItem):
+    pass
+
+
+class Switch(_SettingItem):
+    pass
+
+
+class Selector(_SettingItem):
+    pass
+
+
+class Divider(_SettingItem):
+    pass
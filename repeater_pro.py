@@ -5,6 +5,18 @@ import traceback
 import os
 import uuid
 import random
+import bisect
+import math
+import heapq
+import queue
+import threading
+import importlib
+import io
+from functools import partial
+from collections import OrderedDict, deque, namedtuple
+
+# Taken before the remaining imports so the plugin's own import time can be logged
+_import_started = time.perf_counter()
 
 # Base classes from the plugin environment
 from base_plugin import BasePlugin, HookResult, HookStrategy
@@ -14,25 +26,17 @@ from android_utils import log, run_on_ui_thread
 
 # Imports from the client environment for interacting with Telegram
 from client_utils import send_request, RequestCallback, get_messages_controller, send_message
-from ui.alert import AlertDialogBuilder
-from client_utils import get_last_fragment
+from client_utils import get_last_fragment, get_connections_manager
 
 # Android-specific imports for threading and Java integration
-from android.os import Handler, Looper
-from java.lang import Runnable, Integer
-from java.chaquopy import dynamic_proxy
+from android.os import Handler, HandlerThread, SystemClock
+from java.lang import Integer
 from org.telegram.tgnet import TLRPC
+from org.telegram.messenger import ChatObject
 from java.util import ArrayList
 
-# UI components for building the settings page
-from ui.settings import Header, Text, Input, Divider
-
-# Utility for parsing Markdown in text
-from markdown_utils import parse_markdown
-
-# Android-specific imports for copy-to-clipboard functionality
-from android.content import ClipData, ClipboardManager, Context
-from android.widget import Toast
+# Dialogs (ui.alert), the settings page (ui.settings), Markdown parsing, the
+# clipboard and the Runnable proxy class are loaded on first use via LazyImports
 
 
 # --- Plugin Metadata ---
@@ -52,67 +56,1466 @@ DEFAULT_SETTINGS = {
     # Behavior settings
     "confirmation_threshold": 100,  # Prompt for confirmation if spam count exceeds this
     "max_spam_limit": 500,         # Hard limit on the number of messages that can be spammed
+    "spamdel_window": 1,           # Sends of the delete command allowed to await confirmation at once
+    "rate_limit_per_sec": 0,       # Send budget in messages per second (0 = only honour server flood waits)
 
     # Delay settings in seconds
     "default_media_delay_sec": 0.2,   # Default delay for media spam if not specified
     "default_deletion_delay_sec": 2.5, # Default delay for auto-deleting messages in .spamdel
+    "flush_deletions_on_stop": True,   # Delete all pending spamdel messages at once when a task is stopped
 
     # Command names
     "cmd_spam": ".spam",
     "cmd_spamdel": ".spamdel",
     "cmd_stop": ".spamstop",
     "cmd_spamdebuglog": ".spamdebuglog",
+    "cmd_spamstats": ".spamstats",
+    "cmd_spamprofile": ".spamprofile",
 
     # File system settings
     "logs_directory": "/storage/emulated/0/Download/spammer_logs",
+
+    # Logging settings
+    "verbose_logging": False,      # Also record DEBUG entries (per-task details)
+    "stream_logs_to_file": False,  # Continuously write logs to rotating files in logs_directory
+    "trace_tasks_to_file": False,  # Write a compressed JSONL trace of every task to logs_directory
 }
 
+# Upper bound for the spamdel_window setting
+MAX_SPAMDEL_WINDOW = 10
+# Messages due for deletion within this many milliseconds of each other are deleted together
+DELETION_BATCH_WINDOW_MS = 250
+# ...but none is deleted earlier than this fraction of its deletion delay before it is due
+DELETION_BATCH_MAX_EARLY = 0.25
+# How long a task that has sent everything waits for its remaining responses before it ends anyway
+TASK_DRAIN_TIMEOUT_MS = 30 * 1000
+# Number of resolved photos/documents kept for reuse by later commands
+INPUT_MEDIA_CACHE_SIZE = 32
+# Send errors caused by an expired or missing file_reference, fixed by re-fetching the message
+FILE_REFERENCE_ERROR = re.compile(r"^FILE_REFERENCE_")
+
+# --- Logging Limits ---
+LOG_BUFFER_CAPACITY = 2000       # Most recent entries kept in memory for the debug log command
+LOG_FILE_MAX_BYTES = 1024 * 1024 # Size at which the streamed log file is rotated
+LOG_FILE_BACKUPS = 3             # Number of rotated log files kept next to the current one
+
+# --- HELPER FUNCTIONS ---
+def _percentile(sorted_values, fraction: float):
+    """Nearest-rank percentile of an already sorted list (0 for an empty list)."""
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def _alert_dialog(activity):
+    """Creates an AlertDialogBuilder, importing the dialog classes the first time."""
+    return LazyImports.load("ui.alert", "AlertDialogBuilder")(activity)
+
+def _utf16_len(text: str) -> int:
+    """Length of a string in UTF-16 code units, the unit of Telegram entity offsets."""
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+# The trailing `[count] [delay]` grammar written backwards. It is matched against the
+# reversed end of the arguments, so the text before the groups is never searched.
+_REVERSED_ARGUMENTS = re.compile(r"\](?:([0-9.]+)\[[\s\u2063]*\])?(\d+)\[[\s\u2063]*")
+_ARGUMENTS_WINDOW = 64  # Characters reversed first; longer runs fall back to the whole text
+
+def _match_bracket_arguments(args: str):
+    r"""
+    Finds a trailing `[count]` or `[count] [delay]` by scanning `args` from the end,
+    in time linear in its length. Returns (text_start, text_end, count, delay) with
+    delay None when absent, or None when the arguments do not end that way.
+    The result is the one re.search(r'^(.*?)?[\s\u2063]*\[(\d+)\](?:[\s\u2063]*\[([0-9.]+)\])?$', args.strip())
+    gives: separators before the count bracket belong to no group, and the text
+    before them cannot hold a line break.
+    """
+    start = len(args) - len(args.lstrip()) if args and args[0].isspace() else 0
+    end = len(args.rstrip()) if args and args[-1].isspace() else len(args)
+    if end - start < 3 or args[end - 1] != "]":
+        return None
+    low = max(start, end - _ARGUMENTS_WINDOW)
+    tail = args[low:end][::-1]
+    match = _REVERSED_ARGUMENTS.match(tail)
+    if low > start and (match is None or match.group(1) is None or match.end() == len(tail)):
+        # A run of digits or separators may reach past the window and hide a longer match
+        tail = args[start:end][::-1]
+        match = _REVERSED_ARGUMENTS.match(tail)
+    if match is None:
+        return None
+    text_end = end - match.end()
+    if args.find("\n", start, text_end) >= 0:
+        return None
+    delay = match.group(1)
+    return start, text_end, match.group(2)[::-1], delay[::-1] if delay is not None else None
+
 # --- HELPER CLASSES ---
+class LazyImports:
+    """
+    Loads UI-only dependencies the first time they are needed, so loading the
+    plugin and the send hook never pay for their Java class lookups. How long
+    each import took is kept in `timings` for the debug log.
+    """
+    timings = {}  # Import name -> milliseconds
+    _loaded = {}
+    _runnable_class = None
+
+    @staticmethod
+    def load(module_name: str, *names):
+        """Returns the named attribute of a module (a tuple for several names), importing it once."""
+        values = []
+        for name in names:
+            key = f"{module_name}.{name}"
+            value = LazyImports._loaded.get(key)
+            if value is None:
+                started = time.perf_counter()
+                value = LazyImports._loaded[key] = getattr(importlib.import_module(module_name), name)
+                LazyImports._record(key, started)
+            values.append(value)
+        return values[0] if len(values) == 1 else tuple(values)
+
+    @staticmethod
+    def runnable(target):
+        """Wraps a callable in a java.lang.Runnable; the proxy class is created on the first call."""
+        runnable_class = LazyImports._runnable_class
+        if runnable_class is None:
+            started = time.perf_counter()
+            Runnable = LazyImports.load("java.lang", "Runnable")
+            dynamic_proxy = LazyImports.load("java.chaquopy", "dynamic_proxy")
+
+            class CallableRunnable(dynamic_proxy(Runnable)):
+                __slots__ = ("target",)
+
+                def __init__(self, target):
+                    super().__init__()
+                    self.target = target
+
+                def run(self):
+                    self.target()
+
+            runnable_class = LazyImports._runnable_class = CallableRunnable
+            LazyImports._record("Runnable proxy class", started)
+        return runnable_class(target)
+
+    @staticmethod
+    def _record(name: str, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        LazyImports.timings[name] = elapsed_ms
+        DebugLogger.debug("Loaded %s in %.2f ms", name, elapsed_ms)
+
+    @staticmethod
+    def summary() -> str:
+        return ", ".join(f"{name} {ms:.2f} ms" for name, ms in LazyImports.timings.items()) or "none"
+
 class DebugLogger:
-    """A static class for handling in-memory logging and saving logs to a file."""
-    logs = []  # A list to hold log entries in memory
+    """
+    A static class for in-memory logging, saving logs to a file and optionally
+    streaming them to rotating files in the background.
+    Entries live in a fixed-size ring buffer as raw (timestamp, level, message, args)
+    tuples and are only formatted when they are saved or streamed.
+    """
+    DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+    LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+    level = INFO  # Entries below this level are dropped before anything is built
+    logs = deque(maxlen=LOG_BUFFER_CAPACITY)  # Ring buffer holding the most recent entries
+    sink = None  # Optional LogFileSink streaming entries to disk
+
+    @staticmethod
+    def log(level: int, message: str, *args):
+        """Records an entry; `message % args` is deferred until the entry is written out."""
+        if level < DebugLogger.level:
+            return
+        entry = (time.time(), level, message, args)
+        DebugLogger.logs.append(entry)
+        sink = DebugLogger.sink
+        if sink is not None:
+            sink.submit(entry)
+
+    @staticmethod
+    def debug(message: str, *args):
+        if DebugLogger.level <= DebugLogger.DEBUG:
+            DebugLogger.log(DebugLogger.DEBUG, message, *args)
+
+    @staticmethod
+    def info(message: str, *args):
+        DebugLogger.log(DebugLogger.INFO, message, *args)
 
     @staticmethod
-    def make_log(log_message: str):
-        """Creates a timestamped log entry and adds it to the in-memory list."""
-        log_entry = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {log_message}"
-        print(f"SPAMMER_LOG: {log_message}")
-        DebugLogger.logs.append(log_entry)
+    def warning(message: str, *args):
+        DebugLogger.log(DebugLogger.WARNING, message, *args)
+
+    @staticmethod
+    def error(message: str, *args):
+        DebugLogger.log(DebugLogger.ERROR, message, *args)
+
+    @staticmethod
+    def format_entry(entry) -> str:
+        """Turns a raw ring-buffer entry into a timestamped log line."""
+        timestamp, level, message, args = entry
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args!r}"
+        return f"[{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}] {DebugLogger.LEVEL_NAMES.get(level, level)}: {message}"
+
+    @staticmethod
+    def configure(verbose: bool, stream_dir: str = None):
+        """Applies the logging settings: the minimum level and the optional file sink."""
+        DebugLogger.level = DebugLogger.DEBUG if verbose else DebugLogger.INFO
+        current = DebugLogger.sink
+        if current is not None and current.log_dir == stream_dir:
+            return
+        DebugLogger.sink = LogFileSink(stream_dir) if stream_dir else None
+        if current is not None:
+            current.close()
+
+    @staticmethod
+    def new_file_path(log_dir: str, prefix: str, extension: str) -> str:
+        """Returns a unique path like <log_dir>/<prefix>-<uuid>.<extension>, creating the directory if needed."""
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        return os.path.join(log_dir, f"{prefix}-{uuid.uuid4()}.{extension}")
 
     @staticmethod
     def save_logs(log_dir: str) -> str:
         """Saves all in-memory logs to a file in the specified directory."""
         if not DebugLogger.logs:
             return "No logs to save."
-        # Generate a unique filename for the log
-        file_name = f"log-{uuid.uuid4()}.txt"
-        save_path = os.path.join(log_dir, file_name)
         try:
-            # Create the directory if it doesn't exist
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            # Write logs to the file and clear the in-memory list
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write("\n".join(DebugLogger.logs))
-            DebugLogger.logs = []
-            return f"Logs saved to: {save_path}"
+            save_path = DebugLogger.new_file_path(log_dir, "log", "txt")
+            # Opened here, so a bad directory is reported and the buffer is kept
+            f = open(save_path, "w", encoding="utf-8")
         except Exception as e:
-            final_error = f"Failed to save logs: {e}\n\n{traceback.format_exc()}"
-            print(final_error)
-            return final_error
+            return f"Failed to save logs: {e}\n\n{traceback.format_exc()}"
+        # Take the buffered entries and format/write them off the calling thread
+        entries = list(DebugLogger.logs)
+        DebugLogger.logs.clear()
+        threading.Thread(target=DebugLogger._write_entries, args=(f, save_path, entries), daemon=True).start()
+        return f"Logs saved to: {save_path}"
+
+    @staticmethod
+    def _write_entries(f, save_path: str, entries: list):
+        try:
+            with f:
+                for entry in entries:
+                    f.write(DebugLogger.format_entry(entry))
+                    f.write("\n")
+        except Exception:
+            log(f"SPAMMER_LOG: failed to write {save_path}: {traceback.format_exc()}")
+            DebugLogger.error("Failed to write %s: %s", save_path, traceback.format_exc())
 
-class SpamTask(dynamic_proxy(Runnable)):
+class LogFileSink:
     """
-    A proxy class that wraps a Python callable into a Java Runnable.
-    This is necessary for scheduling tasks on the Android main thread using a Handler.
+    Streams log entries to size-rotated files in a directory from a background thread.
+    If the thread stops on an error (unwritable directory, full disk), it detaches
+    itself from DebugLogger so entries no longer pile up in its queue.
     """
-    def __init__(self, runnable):
-        super().__init__()
-        self.runnable = runnable
+    FILE_NAME = "spammer.log"
+
+    def __init__(self, log_dir: str, max_bytes: int = LOG_FILE_MAX_BYTES, backup_count: int = LOG_FILE_BACKUPS):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="SpammerLogSink", daemon=True)
+        self._thread.start()
+
+    def submit(self, entry):
+        self._queue.put(entry)
+
+    def close(self):
+        """Asks the writer thread to write out what is queued and stop; does not wait for it."""
+        self._queue.put(None)
+
+    def _rotate(self, path: str):
+        # spammer.log -> spammer.log.1 -> ... -> spammer.log.<backup_count>
+        for index in range(self.backup_count - 1, 0, -1):
+            older = f"{path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def _run(self):
+        path = os.path.join(self.log_dir, self.FILE_NAME)
+        f = None
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            f = open(path, "a", encoding="utf-8")
+            size = f.tell()
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    break
+                line = DebugLogger.format_entry(entry) + "\n"
+                if size and size + len(line) > self.max_bytes:
+                    f.close()
+                    self._rotate(path)
+                    f = open(path, "a", encoding="utf-8")
+                    size = 0
+                f.write(line)
+                size += len(line)
+                if self._queue.empty():
+                    f.flush()
+        except Exception:
+            log(f"SPAMMER_LOG: log sink stopped: {traceback.format_exc()}")
+            # Nothing reads the queue any more, so stop feeding it
+            if DebugLogger.sink is self:
+                DebugLogger.sink = None
+        finally:
+            if f is not None:
+                f.close()
+
+class ProfileSession:
+    """
+    An on-demand cProfile and/or tracemalloc capture for the next task or the next
+    N hook calls. cProfile only sees the thread that enables it, so each profiled
+    callback runs through call(), which enables the profiler around it on whatever
+    thread runs it. The report is formatted and written to the logs directory in
+    the background once the session finishes.
+    """
+    MODES = ("all", "cpu", "mem")
+    TOP_FUNCTIONS = 40
+    TOP_ALLOCATIONS = 25
+
+    __slots__ = ("log_dir", "cpu", "memory", "hooks_left", "label", "profile", "traced", "snapshot", "started_at", "elapsed",
+                 "calls", "depth", "finished", "lock")
+
+    def __init__(self, log_dir: str, hook_calls: int = 0, mode: str = "all"):
+        self.log_dir = log_dir
+        self.cpu = mode in ("all", "cpu")
+        self.memory = mode in ("all", "mem")
+        self.hooks_left = hook_calls  # 0 profiles the next task instead
+        self.label = None
+        self.profile = None
+        self.traced = False  # Whether this session started tracemalloc
+        self.snapshot = None
+        self.started_at = None
+        self.elapsed = 0.0
+        self.calls = 0
+        self.depth = 0  # Profiled callbacks currently running
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def start(self, label: str):
+        self.label = label
+        if self.cpu:
+            import cProfile
+            self.profile = cProfile.Profile()
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.traced = True
+        self.started_at = time.perf_counter()
+        DebugLogger.info("Profiling %s (cpu: %s, memory: %s)", label, self.cpu, self.memory)
+
+    def call(self, target, *args):
+        """Runs target(*args) with the profiler enabled on the calling thread."""
+        with self.lock:
+            active = not self.finished
+            if active:
+                profile = self.profile  # None in memory-only sessions
+                self.calls += 1
+                self.depth += 1
+        if not active:
+            return target(*args)
+        try:
+            return target(*args) if profile is None else profile.runcall(target, *args)
+        finally:
+            with self.lock:
+                self.depth -= 1
+                write = self.finished and self.depth == 0
+            if write:
+                self._write()
+
+    def finish(self):
+        """Ends the session; the report is written once no profiled callback is running."""
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            self.elapsed = time.perf_counter() - self.started_at if self.started_at is not None else 0.0
+            if self.memory:
+                import tracemalloc
+                if tracemalloc.is_tracing():
+                    self.snapshot = tracemalloc.take_snapshot()
+                if self.traced:
+                    tracemalloc.stop()
+            write = self.depth == 0
+        if write:
+            self._write()
+
+    def _write(self):
+        try:
+            save_path = DebugLogger.new_file_path(self.log_dir, "profile", "txt")
+        except Exception:
+            DebugLogger.error("Failed to save profile: %s", traceback.format_exc())
+            return
+        threading.Thread(target=self._write_report, args=(save_path,), name="SpammerProfileWriter", daemon=True).start()
+
+    def _write_report(self, save_path: str):
+        try:
+            out = io.StringIO()
+            out.write(f"Profile of {self.label}: {self.calls} profiled callback(s) over {self.elapsed:.2f} s\n")
+            if self.profile is not None:
+                import pstats
+                stats = pstats.Stats(self.profile, stream=out)
+                stats.strip_dirs()
+                out.write("\n=== CPU by cumulative time (cProfile) ===\n")
+                stats.sort_stats("cumulative").print_stats(self.TOP_FUNCTIONS)
+                out.write("\n=== CPU by own time (cProfile) ===\n")
+                stats.sort_stats("tottime").print_stats(self.TOP_FUNCTIONS)
+                # The raw stats can be opened with pstats or snakeviz on a desktop
+                self.profile.dump_stats(os.path.splitext(save_path)[0] + ".prof")
+            if self.snapshot is not None:
+                allocations = self.snapshot.statistics("lineno")
+                out.write(f"\n=== Memory: top {self.TOP_ALLOCATIONS} allocation sites still held (tracemalloc) ===\n")
+                out.write(f"{sum(stat.size for stat in allocations) / 1024:.1f} KiB in {sum(stat.count for stat in allocations)} blocks\n")
+                for stat in allocations[:self.TOP_ALLOCATIONS]:
+                    out.write(f"{stat}\n")
+            with open(save_path, "w", encoding="utf-8") as f:
+                f.write(out.getvalue())
+            DebugLogger.info("Profile of %s saved to: %s", self.label, save_path)
+        except Exception:
+            log(f"SPAMMER_LOG: failed to write {save_path}: {traceback.format_exc()}")
+
+class TaskTrace:
+    """
+    Structured trace of one task: a compact JSON record per send, response, error
+    and deletion, written to a gzip-compressed JSONL file in the logs directory.
+    Timestamps (`t`) are SystemClock uptime in ms, which is monotonic, and every
+    record carries the task id. The task thread only queues tuples; formatting
+    and compression happen on a background thread. The file is complete once
+    the trace is closed, which happens as soon as the task has drained.
+    """
+    __slots__ = ("task_id", "path", "closed", "_queue", "_thread")
+
+    def __init__(self, log_dir: str, label: str, count: int, delay_ms: int, deletion_ms: int = None):
+        self.task_id = uuid.uuid4().hex[:12]
+        self.path = DebugLogger.new_file_path(log_dir, "trace", "jsonl.gz")
+        self.closed = False
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="SpammerTraceWriter", daemon=True)
+        self._thread.start()
+        self.record("task", SystemClock.uptimeMillis(), {"kind": label, "count": count, "delay_ms": delay_ms, "deletion_ms": deletion_ms,
+                                                         "wall": round(time.time(), 3)})
+
+    def record(self, event: str, now_ms: int, fields: dict = None):
+        if not self.closed:
+            self._queue.put((event, now_ms, fields))
+
+    def close(self):
+        """Ends the trace, once; the writer thread finishes the file without being waited for."""
+        if not self.closed:
+            self.closed = True
+            self._queue.put(None)
+
+    def _run(self):
+        try:
+            import gzip
+            import json
+            encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+            with gzip.open(self.path, "wt", encoding="utf-8") as f:
+                while True:
+                    item = self._queue.get()
+                    if item is None:
+                        break
+                    event, now_ms, fields = item
+                    record = {"t": now_ms, "task": self.task_id, "ev": event}
+                    if fields:
+                        record.update(fields)
+                    f.write(encode(record))
+                    f.write("\n")
+        except Exception:
+            log(f"SPAMMER_LOG: trace writer stopped: {traceback.format_exc()}")
+            # Nothing reads the queue any more, so record() stops feeding it
+            self.closed = True
+
+def _profiled(profiler, target):
+    """Returns target unchanged, or wrapped to run under the profiler."""
+    return target if profiler is None else partial(profiler.call, target)
+
+class CancellationToken:
+    """
+    Tracks what one task can still have outstanding: the Runnables it posts and
+    the requests awaiting a response. cancel() removes and cancels all of them in
+    one pass, except requests the task still wants answered.
+    """
+    __slots__ = ("handler", "runnables", "requests", "cancelled")
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.runnables = []  # Every Runnable the task posts, registered once
+        self.requests = {}  # Key (random_id, "refresh") -> request token from send_request
+        self.cancelled = False
+
+    def track_runnable(self, runnable):
+        self.runnables.append(runnable)
+        return runnable
+
+    def track_request(self, key, request_token):
+        self.requests[key] = request_token
+
+    def request_done(self, key):
+        self.requests.pop(key, None)
+
+    def cancel(self, keep=()) -> int:
+        """Removes every posted Runnable and cancels every outstanding request not in `keep`; returns the requests cancelled."""
+        self.cancelled = True
+        for runnable in self.runnables:
+            self.handler.removeCallbacks(runnable)
+        cancelled = [key for key in self.requests if key not in keep]
+        if cancelled:
+            connections = get_connections_manager()
+            for key in cancelled:
+                connections.cancelRequest(self.requests.pop(key), True)
+        return len(cancelled)
+
+class DeletionQueue:
+    """
+    Deletes the messages of one task in batches using a single timer. Message IDs
+    wait in a heap ordered by deletion time; whenever the timer fires, every ID
+    due within the batch window is removed with one deleteMessages call. The
+    window is DELETION_BATCH_WINDOW_MS, shortened for short deletion delays so a
+    message is never deleted much earlier than asked. The call is handed to the
+    UI thread while the timer stays on the task thread.
+    """
+    __slots__ = ("plugin", "chat_id", "channel_id", "stats", "cancellation", "on_empty", "batch_window_ms", "pending", "timer", "timer_at",
+                 "batches")
+
+    def __init__(self, plugin, chat_id, stats, cancellation, on_empty, deletion_ms: int, profiler=None):
+        self.plugin = plugin
+        self.batch_window_ms = min(DELETION_BATCH_WINDOW_MS, int(deletion_ms * DELETION_BATCH_MAX_EARLY))
+        self.on_empty = on_empty  # Called when the timer leaves nothing pending
+        self.cancellation = cancellation
+        self.chat_id = chat_id
+        self.stats = stats
+        # Handle channel IDs which are different from group/user IDs
+        self.channel_id = int(str(chat_id)[4:]) if str(chat_id).startswith("-100") else 0
+        self.pending = []  # Heap of (deletion uptime, message_id)
+        self.timer = cancellation.track_runnable(LazyImports.runnable(_profiled(profiler, self.run)))
+        self.timer_at = None  # Uptime the timer is posted for, None when idle
+        self.batches = 0
+
+    def add(self, message_id: int, delete_at: int):
+        """Queues a message for deletion at the given uptime."""
+        heapq.heappush(self.pending, (delete_at, message_id))
+        self._arm()
+
+    def _arm(self):
+        """Makes sure the single timer is posted for the earliest pending deletion."""
+        if not self.pending:
+            return
+        due = self.pending[0][0]
+        if self.timer_at is not None:
+            if self.timer_at <= due:
+                return
+            self.plugin.task_handler.removeCallbacks(self.timer)
+        self.timer_at = due
+        self.plugin.task_handler.postAtTime(self.timer, due)
 
     def run(self):
-        """This method is called by the Android Handler when the task executes."""
-        self.runnable()
+        """Timer callback: deletes every message that is due, or nearly due, in one request."""
+        with self.plugin.task_lock:
+            if self.cancellation.cancelled:
+                return
+            self.timer_at = None
+            limit = SystemClock.uptimeMillis() + self.batch_window_ms
+            id_list = ArrayList()
+            while self.pending and self.pending[0][0] <= limit:
+                id_list.add(Integer(heapq.heappop(self.pending)[1]))
+            if not id_list.isEmpty():
+                self._delete(id_list)
+            self._arm()
+            if not self.pending:
+                self.on_empty()
+
+    def delete_now(self, message_ids):
+        """Deletes the given messages right away in one request, without the timer."""
+        id_list = ArrayList()
+        for message_id in message_ids:
+            id_list.add(Integer(message_id))
+        self._delete(id_list)
+
+    def flush(self) -> int:
+        """Deletes every pending message right away in one request; returns how many."""
+        id_list = ArrayList()
+        while self.pending:
+            id_list.add(Integer(heapq.heappop(self.pending)[1]))
+        self.timer_at = None
+        if not id_list.isEmpty():
+            self._delete(id_list)
+        return id_list.size()
+
+    def discard(self) -> int:
+        """Drops every pending deletion; returns how many."""
+        dropped = len(self.pending)
+        self.pending.clear()
+        self.timer_at = None
+        return dropped
+
+    def _delete(self, id_list):
+        # deleteMessages updates message state and posts NotificationCenter events, which the client only allows on the main thread
+        run_on_ui_thread(partial(self._delete_on_ui_thread, id_list, self.chat_id, self.channel_id))
+        self.batches += 1
+        self.stats.record_deleted(SystemClock.uptimeMillis(), id_list.size())
+
+    @staticmethod
+    def _delete_on_ui_thread(id_list, chat_id, channel_id):
+        try:
+            get_messages_controller().deleteMessages(id_list, None, None, chat_id, 0, True, channel_id)
+        except Exception:
+            DebugLogger.error("ERROR deleting %d message(s): %s", id_list.size(), traceback.format_exc())
+
+class TaskRunner:
+    """
+    Runs one spam task on the plugin's task thread. Each run() sends a single
+    message and re-posts the same Runnable for the next one, so a task of any
+    length uses one Java proxy for its sends. Every request gets its own callback
+    carrying its random_id, so errors are matched to the send that failed. Text
+    and media, with or without deletion, share this class.
+    """
+    __slots__ = ("plugin", "template", "remaining", "scheduler", "stats", "deletion_ms", "deletions", "window", "in_flight", "posted",
+                 "next_index", "retry_indexes", "runnable", "drain_timeout", "responses", "drain", "drain_posted", "refreshing", "refresh_spent", "stale_sends",
+                 "flushing", "cancellation", "profiler", "label")
+
+    def __init__(self, plugin, template, count: int, delay_ms: int, deletion_ms: int = None, window: int = 1, profiler=None):
+        self.plugin = plugin
+        self.template = template
+        self.remaining = count
+        self.scheduler = DeadlineScheduler(delay_ms)
+        self.deletion_ms = deletion_ms  # None unless sent messages are deleted again
+        # Sends awaiting their response, keyed by random_id. In deletion mode at
+        # most `window` of them may be outstanding before sending pauses.
+        self.window = max(1, min(window, count))
+        self.in_flight = {}
+        self.posted = False
+        # Position of the next new message in the task ({i}), and positions of rejected sends to fill first
+        self.next_index = 1
+        self.retry_indexes = []
+        # Every Runnable and request of the task is registered here, so a stop can drop them all at once
+        self.cancellation = CancellationToken(plugin.task_handler)
+        self.profiler = profiler  # ProfileSession wrapping the task's callbacks, if one was requested
+        self.runnable = self.cancellation.track_runnable(LazyImports.runnable(_profiled(profiler, self.run)))
+        # Ends the task if responses to its last sends never arrive
+        self.drain_timeout = self.cancellation.track_runnable(LazyImports.runnable(self.on_drain_timeout))
+        # Responses arrive on a network thread and are handled on the task thread
+        self.responses = deque()
+        self.drain = self.cancellation.track_runnable(LazyImports.runnable(_profiled(profiler, self.drain_responses)))
+        self.drain_posted = False
+        # File reference renewal: a re-fetch is in progress / was used up by the current expiry /
+        # sends still in flight with the old reference
+        self.refreshing = False
+        self.refresh_spent = False
+        self.stale_sends = 0
+        # Stopped with deletions flushed: sends still in flight are answered, then their messages deleted
+        self.flushing = False
+        is_media = template.media is not None
+        if deletion_ms is None:
+            self.label = "media spam" if is_media else "text spam"
+        else:
+            self.label = "spamdel media" if is_media else "spamdel"
+        self.stats = TaskStats(self.label, SystemClock.uptimeMillis())
+        self.deletions = DeletionQueue(plugin, template.chat_id, self.stats, self.cancellation, self.close_trace_if_drained,
+                                       deletion_ms, profiler) if deletion_ms is not None else None
+
+    def _is_current(self) -> bool:
+        return self.plugin.spam_active and self.plugin.scheduled_task is self
+
+    def run(self):
+        """Sends the next message of the task."""
+        with self.plugin.task_lock:
+            self._send_next()
+
+    def _send_next(self):
+        plugin = self.plugin
+        try:
+            if plugin.scheduled_task is not self:
+                return  # A stale post from a task that was stopped or replaced
+            self.posted = False
+            # Stop condition: task cancelled, or all messages sent and answered
+            if not plugin.spam_active:
+                return plugin._cleanup_task()
+            if self.remaining <= 0:
+                return None if self.in_flight else plugin._cleanup_task()
+            if self.refreshing:
+                return  # Resumed once the renewed file reference arrives
+            now = SystemClock.uptimeMillis()
+            # Hold the send while the server's flood wait or the rate budget says so
+            allowed_at = plugin.rate_controller.acquire(now)
+            if allowed_at > now:
+                self.posted = True
+                plugin.task_handler.postAtTime(self.runnable, allowed_at)
+                return
+            self.scheduler.mark_fired(now)
+            self.remaining -= 1
+            if self.retry_indexes:
+                index = heapq.heappop(self.retry_indexes)
+            else:
+                index = self.next_index
+                self.next_index += 1
+            request = self.template.build(index)
+            self.in_flight[request.random_id] = now
+            callback = RequestCallback(partial(self.on_network_response, request.random_id, index))
+            self.cancellation.track_request(request.random_id, send_request(request, callback))
+            self.stats.record_send(now)
+            if self.deletion_ms is None:
+                plugin.messages_sent_count += 1
+            if self.remaining <= 0:
+                plugin.task_handler.removeCallbacks(self.drain_timeout)
+                plugin.task_handler.postAtTime(self.drain_timeout, now + TASK_DRAIN_TIMEOUT_MS)
+            # Keep sending on schedule; in deletion mode a full window waits for an acknowledgement.
+            # Once everything is sent the task ends with the last response, so late flood waits are resent.
+            self._schedule_next(now)
+        except Exception:
+            DebugLogger.error("ERROR in %s: %s", self.label, traceback.format_exc())
+            if plugin.scheduled_task is self:
+                plugin._cleanup_task()
+
+    def _schedule_next(self, now: int):
+        """Posts the next send if one is left, none is posted and (in deletion mode) the window has room."""
+        if self.remaining <= 0 or self.posted or self.refreshing or not self._is_current():
+            return
+        if self.deletion_ms is not None and len(self.in_flight) >= self.window:
+            return
+        self.posted = True
+        self.plugin.task_handler.postAtTime(self.runnable, self.scheduler.next_deadline(now))
+
+    def _acknowledge(self, random_id):
+        """Removes a send from the in-flight set; returns when it was sent, or None if it is not in flight."""
+        self.cancellation.request_done(random_id)
+        return self.in_flight.pop(random_id, None)
+
+    def _requeue(self, index: int):
+        """Puts a message the server rejected back, so it is sent again under the same position."""
+        if self.remaining <= 0:
+            self.plugin.task_handler.removeCallbacks(self.drain_timeout)  # Posted again after the new last send
+        self.remaining += 1
+        heapq.heappush(self.retry_indexes, index)
+        if self.deletion_ms is None:
+            self.plugin.messages_sent_count -= 1
+
+    def on_drain_timeout(self):
+        """Ends a task whose last sends were never answered; responses arriving later are still recorded."""
+        with self.plugin.task_lock:
+            if self.plugin.scheduled_task is not self or self.remaining > 0 or not self.in_flight:
+                return
+            DebugLogger.warning("%s: %d send(s) unanswered %d s after the last one, ending the task",
+                                self.label, len(self.in_flight), TASK_DRAIN_TIMEOUT_MS // 1000)
+            self.plugin._cleanup_task()
+
+    def on_network_response(self, random_id, index, response, error):
+        """Request callback of the send with the given random_id, called on a network thread: queues the response for the task thread."""
+        self._queue_response(partial(self.on_response, random_id, index), response, error)
+
+    def on_refresh_network_response(self, response, error):
+        """Callback of the message re-fetch, called on a network thread."""
+        self._queue_response(self.on_refresh_response, response, error)
+
+    def _queue_response(self, handler, response, error):
+        if self.cancellation.cancelled and not self.flushing:
+            self.stats.late_responses += 1
+            return
+        self.responses.append((handler, response, error))
+        if not self.drain_posted:
+            self.drain_posted = True
+            self.plugin.task_handler.post(self.drain)
+
+    def drain_responses(self):
+        """Handles every queued response on the task thread."""
+        # Cleared first, so a response queued while draining posts a new drain
+        self.drain_posted = False
+        responses = self.responses
+        with self.plugin.task_lock:
+            while responses:
+                handler, response, error = responses.popleft()
+                handler(response, error)
+
+    def _refresh_media(self) -> bool:
+        """
+        Handles a file reference error by re-fetching the message the media came
+        from, once per expiry. Returns False if the reference cannot be renewed.
+        """
+        if self.refreshing or self.stale_sends > 0:
+            # Sent with the old reference before the re-fetch started
+            self.stale_sends = max(0, self.stale_sends - 1)
+            return True
+        if self.refresh_spent:
+            return False  # Already renewed, and no send has worked since
+        request = self.template.refresh_request()
+        if request is None:
+            return False
+        self.refreshing = self.refresh_spent = True
+        self.stale_sends = len(self.in_flight)
+        DebugLogger.info("%s: file reference rejected, re-fetching message %s", self.label, self.template.source_msg_id)
+        self.cancellation.track_request("refresh", send_request(request, RequestCallback(self.on_refresh_network_response)))
+        return True
+
+    def on_refresh_response(self, response, error):
+        """Handles the re-fetched message: swaps in the renewed media and resumes sending."""
+        plugin = self.plugin
+        self.refreshing = False
+        self.cancellation.request_done("refresh")
+        if plugin.scheduled_task is not self:
+            return
+        input_media = None
+        if not error:
+            input_media = plugin.resolve_input_media(plugin.find_message_media(response, self.template.source_msg_id), refreshed=True)
+        if input_media is None:
+            DebugLogger.error("%s: could not renew the file reference: %s", self.label, error.text if error else "message or media not found")
+            return plugin._cleanup_task()
+        self.template.media = input_media
+        DebugLogger.info("%s: file reference renewed, resuming with %d message(s) left", self.label, self.remaining)
+        self._schedule_next(SystemClock.uptimeMillis())
+
+    def on_response(self, random_id, index, response, error):
+        """Handles the response to one send: flood waits, and in deletion mode the deletion and the next send."""
+        plugin = self.plugin
+        now = SystemClock.uptimeMillis()
+        sent_at = self._acknowledge(random_id)
+        if error:
+            # Flood waits are honoured even when they arrive after the task ended
+            must_wait = plugin.rate_controller.on_error(error.text, now)
+        if plugin.scheduled_task is not self:
+            self.stats.record_response(sent_at, now, error.text if error else None)
+            if self.deletions is not None and sent_at is not None and not error:
+                # Sent before the task ended: the message is still deleted, right away if the task was stopped
+                message_ids = self._message_ids(response, random_id)
+                if self.flushing:
+                    self.deletions.delete_now(message_ids)
+                else:
+                    for message_id in message_ids:
+                        self.deletions.add(message_id, now + self.deletion_ms)
+            if not self.in_flight:
+                self.flushing = False
+                self.close_trace_if_drained()
+            return
+        try:
+            if error:
+                self.stats.record_response(sent_at, now, error.text)
+                if self.template.media is not None and FILE_REFERENCE_ERROR.match(error.text or ""):
+                    if not self._refresh_media():
+                        raise Exception(f"TLRPC Error: {error.text} (file reference could not be renewed)")
+                    # Sent again with the renewed reference
+                    self._requeue(index)
+                    return
+                if must_wait:
+                    # The message was rejected, not sent: send it again once the pause is over
+                    self._requeue(index)
+                elif self.deletion_ms is None:
+                    DebugLogger.warning("%s send failed: %s", self.label, error.text)  # Plain sends carry on past other errors
+                else:
+                    raise Exception(f"TLRPC Error: {error.text}")
+                return self._continue(now)
+            if self.stale_sends:
+                self.stale_sends -= 1
+            elif not self.refreshing:
+                self.refresh_spent = False  # The current reference works, so a later expiry may be renewed again
+            if self.deletion_ms is None:
+                self.stats.record_response(sent_at, now)
+                return self._continue(now)
+            message_ids = self._message_ids(response, random_id)
+            if not message_ids:
+                self.stats.record_response(sent_at, now, "NO_MESSAGE_ID")
+                raise Exception("Could not get message ID to delete.")
+            self.stats.record_response(sent_at, now)
+            plugin.messages_sent_count += 1
+            # Queue the deletion of the sent message
+            for message_id in message_ids:
+                self.deletions.add(message_id, now + self.deletion_ms)
+            self._continue(now)
+        except Exception:
+            DebugLogger.error("ERROR in %s callback: %s", self.label, traceback.format_exc())
+            plugin._cleanup_task()
+
+    def _message_ids(self, response, random_id) -> list:
+        """IDs of the messages the send with this random_id created; responses without a random_id can only be about it."""
+        return [message_id for sent_id, message_id in self.plugin.extract_sent_ids(response) if sent_id is None or sent_id == random_id]
+
+    def _continue(self, now: int):
+        """After a response: ends the task once everything is sent and answered, otherwise schedules the next send."""
+        if not self._is_current() or (self.remaining <= 0 and not self.in_flight):
+            self.plugin._cleanup_task()
+        else:
+            self._schedule_next(now)
+
+    def is_drained(self) -> bool:
+        """Whether the task has ended with no send in flight and no deletion pending."""
+        return self.plugin.scheduled_task is not self and not self.in_flight and (self.deletions is None or not self.deletions.pending)
+
+    def close_trace_if_drained(self):
+        """Closes the task's trace once nothing more can be recorded in it."""
+        if self.stats.trace is not None and self.is_drained():
+            self.stats.trace.close()
+
+    def cancel(self, flush_deletions: bool):
+        """
+        Stops the task for good: posted Runnables, outstanding requests and queued
+        responses are dropped in one pass, and pending deletions are flushed as a
+        single request or discarded. When flushing, sends still in flight are kept:
+        they have usually been delivered already, so their messages are deleted as
+        the acknowledgements arrive. Records how long that took and what was dropped.
+        """
+        if self.cancellation.cancelled:
+            return
+        started = time.perf_counter()
+        self.flushing = flush_deletions and self.deletions is not None and bool(self.in_flight)
+        # Runnables actually waiting on the handler, then the requests and responses still pending
+        discarded = int(self.posted) + int(self.drain_posted and not self.flushing)
+        if self.deletions is not None and self.deletions.timer_at is not None:
+            discarded += 1
+        discarded += self.cancellation.cancel(self.in_flight if self.flushing else ())
+        self.posted = self.drain_posted = False
+        if self.flushing:
+            if self.responses:
+                # Responses already queued may hold acknowledgements of the kept sends
+                self.drain_posted = True
+                self.plugin.task_handler.post(self.drain)
+        else:
+            discarded += len(self.responses)
+            self.responses.clear()
+            self.in_flight.clear()
+        flushed = dropped = 0
+        if self.deletions is not None:
+            if flush_deletions:
+                flushed = self.deletions.flush()
+            else:
+                dropped = self.deletions.discard()
+        self.stats.record_cancel((time.perf_counter() - started) * 1000, discarded, flushed, dropped)
+
+class TaskStats:
+    """
+    Telemetry of one task: a fixed-bucket histogram of request-to-response
+    latency, acknowledgement/error/deletion counts and the achieved send rate.
+    Every event is also passed to the task's TaskTrace when tracing is enabled.
+    """
+    # Upper bounds of the latency buckets in milliseconds; a last bucket catches the rest
+    LATENCY_BOUNDS_MS = (25, 50, 100, 200, 400, 800, 1600, 3200, 6400)
+
+    __slots__ = ("label", "started_at", "ended_at", "sends", "acks", "errors", "deleted", "histogram", "latency_max", "cancellation",
+                 "late_responses", "trace")
+
+    def __init__(self, label: str, started_at: int):
+        self.label = label
+        self.started_at = started_at
+        self.ended_at = None
+        self.sends = 0
+        self.acks = 0
+        self.errors = {}  # error text -> count
+        self.deleted = 0
+        self.histogram = [0] * (len(self.LATENCY_BOUNDS_MS) + 1)
+        self.latency_max = 0
+        self.cancellation = None  # (ms, callbacks discarded, deletions flushed, deletions dropped) once stopped
+        self.late_responses = 0  # Responses that arrived after the stop and were discarded
+        self.trace = None  # TaskTrace, when task traces are saved
+
+    def record_send(self, now_ms: int):
+        self.sends += 1
+        if self.trace is not None:
+            self.trace.record("send", now_ms)
+
+    def record_deleted(self, now_ms: int, count: int):
+        self.deleted += count
+        if self.trace is not None:
+            self.trace.record("del", now_ms, {"n": count})
+
+    def record_response(self, sent_at, now_ms: int, error_text: str = None):
+        """Counts a response; its latency is recorded when the matching send time is known."""
+        if error_text is None:
+            self.acks += 1
+        else:
+            self.errors[error_text] = self.errors.get(error_text, 0) + 1
+        latency = None
+        if sent_at is not None:
+            latency = now_ms - sent_at
+            self.histogram[bisect.bisect_left(self.LATENCY_BOUNDS_MS, latency)] += 1
+            if latency > self.latency_max:
+                self.latency_max = latency
+        if self.trace is not None:
+            fields = {} if latency is None else {"lat": latency}
+            if error_text is not None:
+                fields["err"] = error_text
+            self.trace.record("ack" if error_text is None else "err", now_ms, fields)
+
+    def record_cancel(self, cancel_ms: float, discarded: int, flushed: int, dropped: int):
+        self.cancellation = (cancel_ms, discarded, flushed, dropped)
+        if self.trace is not None:
+            self.trace.record("stop", SystemClock.uptimeMillis(),
+                              {"cancel_ms": round(cancel_ms, 3), "discarded": discarded, "flushed": flushed, "dropped": dropped})
+
+    def finish(self, now_ms: int):
+        if self.ended_at is None:
+            self.ended_at = now_ms
+            if self.trace is not None:
+                self.trace.record("end", now_ms, {"sends": self.sends, "acks": self.acks})
+
+    def latency_percentile(self, fraction: float) -> str:
+        """Upper bound of the bucket holding the given fraction of responses."""
+        total = sum(self.histogram)
+        if not total:
+            return "n/a"
+        rank = max(1, math.ceil(fraction * total))
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank:
+                if index < len(self.LATENCY_BOUNDS_MS):
+                    return f"≤{self.LATENCY_BOUNDS_MS[index]} ms"
+                return f">{self.LATENCY_BOUNDS_MS[-1]} ms"
+        return "n/a"
+
+    def summary(self) -> str:
+        """Multi-line report for dialogs and the debug log."""
+        end = self.ended_at if self.ended_at is not None else SystemClock.uptimeMillis()
+        elapsed_sec = max(0, end - self.started_at) / 1000
+        rate = self.sends / elapsed_sec if elapsed_sec > 0 else 0.0
+        error_count = sum(self.errors.values())
+        lines = [
+            f"Task: {self.label}{'' if self.ended_at is not None else ' (running)'}",
+            f"Sent: {self.sends}, acknowledged: {self.acks}, errors: {error_count}, deleted: {self.deleted}",
+            f"Throughput: {rate:.2f} msg/s over {elapsed_sec:.1f} s",
+            f"Latency: p50 {self.latency_percentile(0.50)}, p90 {self.latency_percentile(0.90)}, "
+            f"p99 {self.latency_percentile(0.99)}, max {self.latency_max} ms",
+        ]
+        labels = [f"≤{bound}" for bound in self.LATENCY_BOUNDS_MS] + [f">{self.LATENCY_BOUNDS_MS[-1]}"]
+        lines.append("Histogram (ms): " + ", ".join(f"{label}: {count}" for label, count in zip(labels, self.histogram) if count))
+        if self.errors:
+            lines.append("Errors: " + ", ".join(f"{text} ×{count}" for text, count in sorted(self.errors.items(), key=lambda item: -item[1])))
+        if self.cancellation is not None:
+            cancel_ms, discarded, flushed, dropped = self.cancellation
+            line = f"Stopped in {cancel_ms:.2f} ms: {discarded} pending callback(s) discarded"
+            if flushed:
+                line += f", {flushed} deletion(s) flushed"
+            if dropped:
+                line += f", {dropped} pending deletion(s) dropped"
+            if self.late_responses:
+                line += f", {self.late_responses} late response(s) ignored"
+            lines.append(line)
+        return "\n".join(lines)
+
+    __str__ = summary
+
+class RateController:
+    """
+    Decides when the next send may go out, shared by every task type. It holds
+    sends to a token-bucket budget (rate_limit_per_sec, with one second of
+    burst) and pauses them for as long as the server asks through
+    FLOOD_WAIT_X, FLOOD_PREMIUM_WAIT_X or SLOWMODE_WAIT_X errors.
+    """
+    WAIT_ERROR = re.compile(r"(?:FLOOD_WAIT|FLOOD_PREMIUM_WAIT|SLOWMODE_WAIT)_(\d+)")
+
+    __slots__ = ("rate_per_sec", "burst", "tokens", "refilled_at", "paused_until", "throttled_ms", "server_waits")
+
+    def __init__(self):
+        self.rate_per_sec = 0.0  # 0 means no budget, only server-requested pauses
+        self.burst = 1.0
+        self.tokens = 1.0
+        self.refilled_at = None
+        self.paused_until = 0  # Uptime before which nothing may be sent
+        self.throttled_ms = 0
+        self.server_waits = 0
+
+    def configure(self, rate_per_sec: float):
+        """Sets the budget for the next task and resets the per-task counters."""
+        self.rate_per_sec = rate_per_sec
+        self.burst = max(1.0, rate_per_sec)
+        self.tokens = self.burst
+        self.refilled_at = None
+        self.throttled_ms = 0
+        self.server_waits = 0
+
+    def acquire(self, now_ms: int) -> int:
+        """Takes a send slot and returns now_ms, or returns the uptime to retry at."""
+        if now_ms < self.paused_until:
+            self.throttled_ms += self.paused_until - now_ms
+            return self.paused_until
+        if self.rate_per_sec <= 0:
+            return now_ms
+        if self.refilled_at is not None:
+            self.tokens = min(self.burst, self.tokens + (now_ms - self.refilled_at) * self.rate_per_sec / 1000)
+        self.refilled_at = now_ms
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return now_ms
+        wait_ms = max(1, math.ceil((1 - self.tokens) * 1000 / self.rate_per_sec))
+        self.throttled_ms += wait_ms
+        return now_ms + wait_ms
+
+    def on_error(self, error_text: str, now_ms: int) -> bool:
+        """Pauses sending if the error asks to wait; returns whether it did."""
+        match = self.WAIT_ERROR.search(error_text or "")
+        if not match:
+            return False
+        self.paused_until = max(self.paused_until, now_ms + int(match.group(1)) * 1000)
+        self.server_waits += 1
+        DebugLogger.info("Server asked to wait %s s (%s)", match.group(1), error_text)
+        return True
+
+class DeadlineScheduler:
+    """
+    Computes absolute send deadlines (start + n * interval) on the uptime clock
+    used by Handler.postAtTime, so send work and network round trips do not add
+    to the configured delay. Records when each send actually ran for the
+    end-of-task timing report.
+    """
+    __slots__ = ("interval_ms", "start_ms", "index", "fired_at", "lateness")
+
+    def __init__(self, interval_ms: int):
+        self.interval_ms = max(0, int(interval_ms))
+        self.start_ms = None
+        self.index = 0
+        self.fired_at = []  # Uptime of every send
+        self.lateness = []  # How far after its deadline each send ran
+
+    def mark_fired(self, now_ms: int):
+        """Records a send; the first one anchors the schedule."""
+        if self.start_ms is None:
+            self.start_ms = now_ms
+        self.fired_at.append(now_ms)
+        self.lateness.append(now_ms - (self.start_ms + self.index * self.interval_ms))
+
+    def next_deadline(self, now_ms: int) -> int:
+        """Returns the uptime at which the next send is due."""
+        self.index += 1
+        deadline = self.start_ms + self.index * self.interval_ms
+        if deadline < now_ms - self.interval_ms:
+            # More than a whole interval behind (e.g. a slow acknowledgement):
+            # re-anchor on now instead of bursting to catch up
+            self.start_ms = now_ms - self.index * self.interval_ms
+            deadline = now_ms
+        return deadline
+
+    def summary(self) -> str:
+        """Achieved mean interval and p50/p99 jitter of the sends so far."""
+        sends = len(self.fired_at)
+        if sends < 2:
+            return f"{sends} send(s), configured interval {self.interval_ms} ms"
+        mean_interval = (self.fired_at[-1] - self.fired_at[0]) / (sends - 1)
+        jitter = sorted(abs(value) for value in self.lateness)
+        return (f"{sends} sends, configured interval {self.interval_ms} ms, achieved mean {mean_interval:.1f} ms, "
+                f"jitter p50 {_percentile(jitter, 0.50)} ms / p99 {_percentile(jitter, 0.99)} ms")
+
+    __str__ = summary
+
+class InputMediaCache:
+    """
+    LRU of resolved InputMedia keyed by photo or document id. Commands reusing the
+    same media share one object, and a file_reference renewed during a task is
+    picked up by later commands, even if the replied-to message has none. Bare
+    repeats look their media up again through key_for().
+    """
+    __slots__ = ("capacity", "entries")
+
+    def __init__(self, capacity: int = INPUT_MEDIA_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        input_media = self.entries.get(key)
+        if input_media is not None:
+            self.entries.move_to_end(key)
+        return input_media
+
+    def put(self, key, input_media):
+        self.entries[key] = input_media
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    @staticmethod
+    def key_for(input_media):
+        """The key a resolved InputMediaPhoto or InputMediaDocument is cached under."""
+        return "photo" if isinstance(input_media, TLRPC.TL_inputMediaPhoto) else "document", input_media.id.id
+
+class MessageTemplate:
+    """
+    Spam text with {i} (message number), {n} (task count) and {ts} (Unix time in
+    ms) placeholders, compiled once into literal and slot segments. Rendering
+    only fills the slots. Entity offsets, counted in UTF-16 code units like
+    Telegram does, are shifted by how much each slot differs from its
+    placeholder, and the entity list is only rebuilt when a slot changes width.
+    """
+    PLACEHOLDER = re.compile(r"\{(i|n|ts)\}")
+    __slots__ = ("parts", "slots", "entities", "widths", "rendered_entities", "rebuilt_objects")
+
+    def __init__(self, text: str, entities=None):
+        self.parts = []  # Literal text with an empty string where each slot goes
+        self.slots = []  # (index in parts, placeholder name, UTF-16 start in the template, placeholder length)
+        position = utf16_position = 0
+        for match in MessageTemplate.PLACEHOLDER.finditer(text):
+            literal = text[position:match.start()]
+            self.parts.append(literal)
+            utf16_position += _utf16_len(literal)
+            self.slots.append((len(self.parts), match.group(1), utf16_position, len(match.group(0))))
+            self.parts.append("")
+            utf16_position += len(match.group(0))
+            position = match.end()
+        self.parts.append(text[position:])
+        # For each entity: the original and the slots before it and inside it
+        self.entities = []
+        for i in range(entities.size() if entities else 0):
+            entity = entities.get(i)
+            end = entity.offset + entity.length
+            before = [k for k, slot in enumerate(self.slots) if slot[2] + slot[3] <= entity.offset]
+            inside = [k for k, slot in enumerate(self.slots) if entity.offset <= slot[2] < end and k not in before]
+            self.entities.append((entity, before, inside))
+        self.widths = None  # Slot widths the current entity list was built for
+        self.rendered_entities = None
+        self.rebuilt_objects = 0
+
+    @staticmethod
+    def compile(text: str, entities=None):
+        """Returns a MessageTemplate if the text has placeholders, otherwise None."""
+        if not text or "{" not in text or not MessageTemplate.PLACEHOLDER.search(text):
+            return None
+        return MessageTemplate(text, entities)
+
+    def render(self, index: int, total: int):
+        """Returns the text and entities (None without entities) of message number `index`."""
+        parts = self.parts
+        widths = []
+        for part_index, name, _, _ in self.slots:
+            if name == "i":
+                value = str(index)
+            elif name == "n":
+                value = str(total)
+            else:
+                value = str(int(time.time() * 1000))
+            parts[part_index] = value
+            widths.append(len(value))  # Digits only, so one UTF-16 unit per character
+        if self.entities and widths != self.widths:
+            self.widths = widths
+            self.rendered_entities = self._shift_entities(widths)
+        return "".join(parts), self.rendered_entities
+
+    def _shift_entities(self, widths):
+        """Builds the entity list for the given slot widths."""
+        deltas = [width - slot[3] for width, slot in zip(widths, self.slots)]
+        shifted = ArrayList()
+        for entity, before, inside in self.entities:
+            new_entity = type(entity)()
+            new_entity.offset = entity.offset + sum(deltas[k] for k in before)
+            new_entity.length = entity.length + sum(deltas[k] for k in inside)
+            if hasattr(entity, 'url'):
+                new_entity.url = entity.url
+            shifted.add(new_entity)
+        self.rebuilt_objects += len(self.entities)
+        return shifted
+
+class SendTemplate:
+    """
+    Everything about a send request that stays the same for a whole task: the
+    resolved peer, the reply header, the entities and the flags.
+    Building a request then only allocates the request itself and a fresh random_id.
+    Text with placeholders is rendered per request through a MessageTemplate.
+    Media remembers the message it came from, so an expired file_reference can be renewed.
+    """
+    __slots__ = ("chat_id", "peer", "message", "text_template", "count", "media", "source_chat_id", "source_msg_id",
+                 "reply_to", "entities", "flags", "setup_objects", "sends")
+
+    def __init__(self, chat_id, text: str = None, input_media=None, reply_to_msg_id=None, entities=None, count: int = 0, media_source=None):
+        self.chat_id = chat_id
+        self.peer = get_messages_controller().getInputPeer(chat_id)
+        self.message = text
+        self.text_template = MessageTemplate.compile(text, entities) if input_media is None else None
+        self.count = count
+        self.media = input_media
+        self.source_chat_id, self.source_msg_id = media_source or (None, None)
+        self.reply_to = None
+        self.entities = None
+        self.flags = 0
+        self.setup_objects = 1  # The resolved peer
+        self.sends = 0
+        # Handle replies
+        if reply_to_msg_id:
+            self.reply_to = TLRPC.TL_inputReplyToMessage()
+            self.reply_to.reply_to_msg_id = reply_to_msg_id
+            self.flags |= 1
+            self.setup_objects += 1
+        # Handle Markdown/formatting entities
+        if entities and not entities.isEmpty():
+            self.entities = entities
+            self.flags |= 8
+
+    def build(self, index: int = 1):
+        """Returns a new send request sharing the template's resolved parts; `index` is the message's position for {i}."""
+        if self.media is not None:
+            req = TLRPC.TL_messages_sendMedia()
+            req.media = self.media
+        else:
+            req = TLRPC.TL_messages_sendMessage()
+            req.message = self.message
+        req.peer = self.peer
+        req.random_id = random.getrandbits(63)
+        if self.reply_to is not None:
+            req.reply_to = self.reply_to
+        if self.entities is not None:
+            req.entities = self.entities
+        if self.text_template is not None:
+            req.message, entities = self.text_template.render(index, self.count)
+            if entities is not None:
+                req.entities = entities
+        req.flags = self.flags
+        self.sends += 1
+        return req
+
+    def refresh_request(self):
+        """Returns a request re-fetching the message the media came from, or None if it is unknown."""
+        if self.media is None or not self.source_msg_id:
+            return None
+        input_message = TLRPC.TL_inputMessageID()
+        input_message.id = self.source_msg_id
+        # Dialog ids of chats are their negated chat ids; channel messages are fetched through the channel
+        source_chat_id = int(self.source_chat_id)
+        chat = get_messages_controller().getChat(-source_chat_id) if source_chat_id < 0 else None
+        if chat is not None and ChatObject.isChannel(chat):
+            req = TLRPC.TL_channels_getMessages()
+            req.channel = get_messages_controller().getInputChannel(-source_chat_id)
+        else:
+            req = TLRPC.TL_messages_getMessages()
+        req.id.add(input_message)
+        return req
+
+    def objects_per_send(self) -> float:
+        """TL objects allocated per request so far, including the one-off setup."""
+        if not self.sends:
+            return 0.0
+        rebuilt = self.text_template.rebuilt_objects if self.text_template is not None else 0
+        return (self.setup_objects + rebuilt + self.sends) / self.sends
+
+class SettingsSnapshot:
+    """
+    A validated, read-only view of the plugin settings.
+    It is built once and reused for every message until a setting changes,
+    so the send hook never has to call get_setting or re-parse numbers.
+    """
+    __slots__ = (
+        "confirmation_threshold", "max_spam_limit", "spamdel_window", "rate_limit_per_sec",
+        "default_media_delay_sec", "default_deletion_delay_sec", "flush_deletions_on_stop",
+        "cmd_spam", "cmd_spamdel", "cmd_stop", "cmd_spamdebuglog", "cmd_spamstats", "cmd_spamprofile",
+        "logs_directory", "verbose_logging", "stream_logs_to_file", "trace_tasks_to_file",
+    )
+
+    def __init__(self, plugin):
+        self.confirmation_threshold = self._read_int(plugin, "confirmation_threshold")
+        self.max_spam_limit = self._read_int(plugin, "max_spam_limit")
+        self.spamdel_window = max(1, min(MAX_SPAMDEL_WINDOW, self._read_int(plugin, "spamdel_window")))
+        self.rate_limit_per_sec = self._read_float(plugin, "rate_limit_per_sec")
+        self.default_media_delay_sec = self._read_float(plugin, "default_media_delay_sec")
+        self.default_deletion_delay_sec = self._read_float(plugin, "default_deletion_delay_sec")
+        self.flush_deletions_on_stop = self._read_bool(plugin, "flush_deletions_on_stop")
+        self.cmd_spam = self._read_text(plugin, "cmd_spam")
+        self.cmd_spamdel = self._read_text(plugin, "cmd_spamdel")
+        self.cmd_stop = self._read_text(plugin, "cmd_stop")
+        self.cmd_spamdebuglog = self._read_text(plugin, "cmd_spamdebuglog")
+        self.cmd_spamstats = self._read_text(plugin, "cmd_spamstats")
+        self.cmd_spamprofile = self._read_text(plugin, "cmd_spamprofile")
+        self.logs_directory = self._read_text(plugin, "logs_directory")
+        self.verbose_logging = self._read_bool(plugin, "verbose_logging")
+        self.stream_logs_to_file = self._read_bool(plugin, "stream_logs_to_file")
+        self.trace_tasks_to_file = self._read_bool(plugin, "trace_tasks_to_file")
+
+    @staticmethod
+    def _read_int(plugin, key: str) -> int:
+        """Reads a non-negative integer setting, falling back to the default on bad input."""
+        try:
+            value = int(float(plugin.get_setting(key, DEFAULT_SETTINGS[key])))
+        except (ValueError, TypeError):
+            return DEFAULT_SETTINGS[key]
+        return value if value >= 0 else DEFAULT_SETTINGS[key]
+
+    @staticmethod
+    def _read_float(plugin, key: str) -> float:
+        """Reads a non-negative number setting, falling back to the default on bad input."""
+        try:
+            value = float(plugin.get_setting(key, DEFAULT_SETTINGS[key]))
+        except (ValueError, TypeError):
+            return DEFAULT_SETTINGS[key]
+        return value if value >= 0 else DEFAULT_SETTINGS[key]
+
+    @staticmethod
+    def _read_bool(plugin, key: str) -> bool:
+        """Reads a switch setting, accepting booleans and their string forms."""
+        value = plugin.get_setting(key, DEFAULT_SETTINGS[key])
+        if isinstance(value, str):
+            return value.strip().lower() in ("true", "1", "yes", "on")
+        return bool(value)
+
+    @staticmethod
+    def _read_text(plugin, key: str) -> str:
+        """Reads a text setting; blank values fall back to the default."""
+        value = plugin.get_setting(key, DEFAULT_SETTINGS[key])
+        if not isinstance(value, str) or not value.strip():
+            return DEFAULT_SETTINGS[key]
+        return value.strip()
+
+class CommandRecord(namedtuple("CommandRecord", "text raw_count count delay entities peer reply_msg_id input_media max_limit")):
+    """
+    An immutable, fully parsed spam command, kept so that a bare repeat command
+    can reuse the parse result and the finished entity list as they are.
+    `count` is `raw_count` clamped to `max_limit`, the limit in force when it was clamped.
+    Only the chat, the reply message id and the resolved InputMedia are kept, never
+    the reply MessageObject or the original entities, so those can be freed.
+    """
+    __slots__ = ()
+
+    def with_max_limit(self, max_limit: int):
+        """Returns a copy re-clamped to a new maximum spam limit."""
+        return self._replace(count=min(self.raw_count, max_limit), max_limit=max_limit)
+
+class CommandDispatcher:
+    """
+    Classifies an outgoing message against the configured command names in one step.
+    Messages whose first character cannot start any command are rejected without
+    lowercasing or matching, which is the path almost every message takes.
+    """
+    PASS, STOP, DEBUGLOG, STATS, PROFILE, SPAM, SPAMDEL, SPAM_REPEAT, SPAMDEL_REPEAT, SPAM_PREFIXED = range(10)
+
+    # Maps the named groups of the compiled pattern to command kinds
+    _GROUP_KINDS = {
+        "stop": STOP,
+        "debuglog": DEBUGLOG,
+        "stats": STATS,
+        "profile": PROFILE,
+        "spamdel": SPAMDEL,
+        "spam": SPAM,
+        "spamdel_repeat": SPAMDEL_REPEAT,
+        "spam_repeat": SPAM_REPEAT,
+        "prefixed": SPAM_PREFIXED,
+    }
+
+    __slots__ = ("names", "_first_chars", "_pattern")
+
+    def __init__(self, cmd_spam: str, cmd_spamdel: str, cmd_stop: str, cmd_spamdebuglog: str, cmd_spamstats: str, cmd_spamprofile: str):
+        self.names = (cmd_spam, cmd_spamdel, cmd_stop, cmd_spamdebuglog, cmd_spamstats, cmd_spamprofile)
+        self._first_chars = frozenset(name[0] for name in self.names)
+        spam, spamdel, stop, debuglog, stats, profile = (re.escape(name) for name in self.names)
+        # Alternatives are tried in order, which preserves the precedence of the
+        # original checks: exact stop/debuglog/stats, the profile command with or
+        # without arguments, "<cmd> args" (spamdel first), bare repeats, and finally
+        # any text that merely starts with a spam command.
+        self._pattern = re.compile(
+            rf"(?P<stop>{stop})\Z|(?P<debuglog>{debuglog})\Z|(?P<stats>{stats})\Z|(?P<profile>{profile})(?:\Z| )"
+            rf"|(?P<spamdel>{spamdel}) |(?P<spam>{spam}) "
+            rf"|(?P<spamdel_repeat>{spamdel})\Z|(?P<spam_repeat>{spam})\Z"
+            rf"|(?P<prefixed>{spam}|{spamdel})",
+            re.DOTALL,
+        )
+
+    def classify(self, message_text: str):
+        """Returns (kind, command_args); command_args is only set for SPAM, SPAMDEL and PROFILE."""
+        if not message_text or message_text[0].lower()[0] not in self._first_chars:
+            return self.PASS, None
+        match = self._pattern.match(message_text.lower())
+        if not match:
+            return self.PASS, None
+        kind = self._GROUP_KINDS[match.lastgroup]
+        if kind == self.SPAM or kind == self.SPAMDEL or kind == self.PROFILE:
+            return kind, message_text[match.end():].strip()
+        return kind, None
 
 # --- MAIN PLUGIN CLASS ---
 class SpammerPlugin(BasePlugin):
@@ -127,61 +1530,143 @@ class SpammerPlugin(BasePlugin):
 
     def on_plugin_load(self):
         """Called when the plugin is loaded by the application."""
-        # A handler to schedule tasks on Android's main UI thread
-        self.main_thread_handler = Handler(Looper.getMainLooper())
+        # Tasks run on their own thread so sends and bookkeeping never compete with UI rendering
+        self.task_thread = HandlerThread("MessageRepeaterTasks")
+        self.task_thread.start()
+        self.task_handler = Handler(self.task_thread.getLooper())
+        # Guards the task state below, which the hook (UI thread) and the task thread both change
+        self.task_lock = threading.RLock()
         # State variables to manage the spamming process
         self.spam_active = False
         self.messages_sent_count = 0
-        self.scheduled_task = None
+        self.scheduled_task = None  # The TaskRunner of the running task
+        self.rate_controller = RateController()  # Send budget and flood waits, shared by all tasks
+        self.last_task_stats = None  # TaskStats of the running or most recent task
+        self.last_task = None  # TaskRunner of the running or most recent task; its deletions may still be pending
         self.last_command_data = None  # To remember the last spam command for repetition
+        self._settings_snapshot = None  # Parsed settings, rebuilt lazily after a change
+        self._command_dispatcher = None  # Compiled command matcher, rebuilt when command names change
+        self.input_media_cache = InputMediaCache()  # Resolved photos/documents by id
+        self.profiler = None  # ProfileSession armed by the profile command, until a task or the hook calls claim it
         # Register the message hook to intercept outgoing messages
         self.add_on_send_message_hook()
+        # Apply the logging settings right away so file streaming starts with the plugin
+        self._get_settings()
+        DebugLogger.debug("Plugin module imported in %.2f ms", LazyImports.timings.get("plugin module", 0.0))
 
     def on_plugin_unload(self):
         """Called when the plugin is unloaded."""
-        # Ensure any running spam task is stopped
-        self.spam_active = False
-        if self.scheduled_task:
-            self.main_thread_handler.removeCallbacks(self.scheduled_task)
-
-    def _cleanup_task(self):
-        """Resets the state of the spam task."""
-        self.spam_active = False
-        self.scheduled_task = None
+        # Ensure any running spam task is stopped, including deletions left by a finished one, then let the task thread exit
+        self._cleanup_task(cancel=True)
+        with self.task_lock:
+            if self.last_task is not None:
+                # A task that already drained has nothing to stop, and its trace must not say it was stopped
+                if not self.last_task.is_drained():
+                    self.last_task.cancel(self._get_settings().flush_deletions_on_stop)
+                self.last_task = None
+        self.task_thread.quitSafely()
+        if self.last_task_stats is not None and self.last_task_stats.trace is not None:
+            self.last_task_stats.trace.close()
+        if self.profiler is not None:
+            self.profiler.finish()
+            self.profiler = None
+        DebugLogger.configure(False, None)
+
+    def _get_settings(self) -> SettingsSnapshot:
+        """Returns the cached settings snapshot, parsing the settings if they changed."""
+        snapshot = self._settings_snapshot
+        if snapshot is None:
+            snapshot = self._settings_snapshot = SettingsSnapshot(self)
+            command_names = (snapshot.cmd_spam, snapshot.cmd_spamdel, snapshot.cmd_stop, snapshot.cmd_spamdebuglog, snapshot.cmd_spamstats,
+                             snapshot.cmd_spamprofile)
+            if self._command_dispatcher is None or self._command_dispatcher.names != command_names:
+                self._command_dispatcher = CommandDispatcher(*command_names)
+            DebugLogger.configure(snapshot.verbose_logging, snapshot.logs_directory if snapshot.stream_logs_to_file else None)
+        return snapshot
+
+    def _invalidate_settings(self, *args):
+        """on_change callback for the settings page: drops the cached snapshot."""
+        self._settings_snapshot = None
+
+    def _cleanup_task(self, cancel: bool = False):
+        """
+        Resets the state of the spam task. With `cancel` (stop command, unload) the
+        task's pending Runnables, requests and deletions are dropped as well; a task
+        that finished, or ended on an error, keeps its pending deletions.
+        """
+        with self.task_lock:
+            self.spam_active = False
+            runner = self.scheduled_task
+            self.scheduled_task = None
+            if runner is not None:
+                if cancel:
+                    runner.cancel(self._get_settings().flush_deletions_on_stop)
+                else:
+                    self.task_handler.removeCallbacks(runner.runnable)
+                    self.task_handler.removeCallbacks(runner.drain_timeout)
+        if runner is not None:
+            if runner.profiler is not None:
+                runner.profiler.finish()
+            with self.task_lock:
+                runner.stats.finish(SystemClock.uptimeMillis())
+                runner.close_trace_if_drained()
+            # The task's own objects are formatted through __str__ when the entry is written out
+            DebugLogger.info("Task finished:\n%s", runner.stats)
+            DebugLogger.info("Task timing: %s", runner.scheduler)
+            rate_controller = self.rate_controller  # Shared with the next task, so its counters are copied now
+            DebugLogger.info("Task rate control: throttled for %d ms, %d server-requested wait(s)",
+                             rate_controller.throttled_ms, rate_controller.server_waits)
+            if DebugLogger.level > DebugLogger.DEBUG:
+                return
+            DebugLogger.debug("Task finished: %d requests built, %.2f TL objects allocated per send",
+                              runner.template.sends, runner.template.objects_per_send())
+            if runner.deletions is not None:
+                DebugLogger.debug("Deletions so far: %d message(s) in %d request(s), %d pending",
+                                  runner.stats.deleted, runner.deletions.batches, len(runner.deletions.pending))
 
     def _copy_to_clipboard(self, text_to_copy: str, label: str):
         """Copies the given text to the device's clipboard."""
         activity = get_last_fragment().getParentActivity()
         if not activity:
             return
+        ClipData, Context = LazyImports.load("android.content", "ClipData", "Context")
+        Toast = LazyImports.load("android.widget", "Toast")
         try:
             clipboard = activity.getSystemService(Context.CLIPBOARD_SERVICE)
             clip = ClipData.newPlainText(label, text_to_copy)
             clipboard.setPrimaryClip(clip)
             Toast.makeText(activity, f"{label} address copied to clipboard!", Toast.LENGTH_SHORT).show()
         except Exception as e:
-            error_message = f"Failed to copy to clipboard: {traceback.format_exc()}"
-            DebugLogger.make_log(error_message)
+            DebugLogger.error("Failed to copy to clipboard: %s", traceback.format_exc())
             Toast.makeText(activity, "Failed to copy address.", Toast.LENGTH_SHORT).show()
 
     def create_settings(self) -> list:
         """Creates the list of UI components for the plugin's settings page."""
+        Header, Text, Input, Divider, Switch = LazyImports.load("ui.settings", "Header", "Text", "Input", "Divider", "Switch")
         return [
             Header(text="Behavior Settings"),
-            Input(key="confirmation_threshold", text="Confirmation Threshold", default=str(DEFAULT_SETTINGS["confirmation_threshold"]), subtext="Show confirmation if spam count exceeds this value."),
-            Input(key="max_spam_limit", text="Max Spam Limit", default=str(DEFAULT_SETTINGS["max_spam_limit"]), subtext="Maximum allowed spam count."),
+            Input(key="confirmation_threshold", text="Confirmation Threshold", default=str(DEFAULT_SETTINGS["confirmation_threshold"]), subtext="Show confirmation if spam count exceeds this value.", on_change=self._invalidate_settings),
+            Input(key="max_spam_limit", text="Max Spam Limit", default=str(DEFAULT_SETTINGS["max_spam_limit"]), subtext="Maximum allowed spam count.", on_change=self._invalidate_settings),
+            Input(key="spamdel_window", text="Spam-Delete Pipelining", default=str(DEFAULT_SETTINGS["spamdel_window"]), subtext=f"Sends allowed to await confirmation at once (1-{MAX_SPAMDEL_WINDOW}). Higher values keep the delay on slow connections.", on_change=self._invalidate_settings),
+            Input(key="rate_limit_per_sec", text="Rate Limit (messages/sec)", default=str(DEFAULT_SETTINGS["rate_limit_per_sec"]), subtext="Maximum send rate for all commands. 0 = no limit; server flood waits are always honoured.", on_change=self._invalidate_settings),
             Divider(),
             Header(text="Default Delays (in seconds)"),
-            Input(key="default_media_delay_sec", text="Media Spam Delay", default=str(DEFAULT_SETTINGS["default_media_delay_sec"]), subtext="Default delay for media if not specified in the command."),
-            Input(key="default_deletion_delay_sec", text="Auto-Deletion Delay", default=str(DEFAULT_SETTINGS["default_deletion_delay_sec"]), subtext=f"Default deletion delay for your spam-delete command."),
+            Input(key="default_media_delay_sec", text="Media Spam Delay", default=str(DEFAULT_SETTINGS["default_media_delay_sec"]), subtext="Default delay for media if not specified in the command.", on_change=self._invalidate_settings),
+            Input(key="default_deletion_delay_sec", text="Auto-Deletion Delay", default=str(DEFAULT_SETTINGS["default_deletion_delay_sec"]), subtext=f"Default deletion delay for your spam-delete command.", on_change=self._invalidate_settings),
+            Switch(key="flush_deletions_on_stop", text="Delete Pending on Stop", default=DEFAULT_SETTINGS["flush_deletions_on_stop"], subtext="When a spam-delete task is stopped, delete its remaining messages at once instead of leaving them.", on_change=self._invalidate_settings),
             Divider(),
             Header(text="Command Settings"),
-            Input(key="cmd_spam", text="Spam Command", default=DEFAULT_SETTINGS["cmd_spam"]),
-            Input(key="cmd_spamdel", text="Spam-Delete Command", default=DEFAULT_SETTINGS["cmd_spamdel"]),
-            Input(key="cmd_stop", text="Stop Command", default=DEFAULT_SETTINGS["cmd_stop"]),
-            Input(key="cmd_spamdebuglog", text="Debug Log Command", default=DEFAULT_SETTINGS["cmd_spamdebuglog"]),
+            Input(key="cmd_spam", text="Spam Command", default=DEFAULT_SETTINGS["cmd_spam"], on_change=self._invalidate_settings),
+            Input(key="cmd_spamdel", text="Spam-Delete Command", default=DEFAULT_SETTINGS["cmd_spamdel"], on_change=self._invalidate_settings),
+            Input(key="cmd_stop", text="Stop Command", default=DEFAULT_SETTINGS["cmd_stop"], on_change=self._invalidate_settings),
+            Input(key="cmd_spamdebuglog", text="Debug Log Command", default=DEFAULT_SETTINGS["cmd_spamdebuglog"], on_change=self._invalidate_settings),
+            Input(key="cmd_spamstats", text="Stats Command", default=DEFAULT_SETTINGS["cmd_spamstats"], on_change=self._invalidate_settings),
+            Input(key="cmd_spamprofile", text="Profile Command", default=DEFAULT_SETTINGS["cmd_spamprofile"], on_change=self._invalidate_settings),
             Divider(),
-            Input(key="logs_directory", text="Logs Directory", default=DEFAULT_SETTINGS["logs_directory"], subtext="Directory to save debug logs."),
+            Input(key="logs_directory", text="Logs Directory", default=DEFAULT_SETTINGS["logs_directory"], subtext="Directory to save debug logs.", on_change=self._invalidate_settings),
+            Switch(key="verbose_logging", text="Verbose Logging", default=DEFAULT_SETTINGS["verbose_logging"], subtext="Also record per-task details in the debug log.", on_change=self._invalidate_settings),
+            Switch(key="stream_logs_to_file", text="Stream Logs to File", default=DEFAULT_SETTINGS["stream_logs_to_file"], subtext="Continuously write logs to rotating files in the logs directory.", on_change=self._invalidate_settings),
+            Switch(key="trace_tasks_to_file", text="Save Task Traces", default=DEFAULT_SETTINGS["trace_tasks_to_file"], subtext="Write every send, response and deletion of a task to a compressed trace file in the logs directory.", on_change=self._invalidate_settings),
             Divider(),
             Text(text="How to Use (FAQ)", icon="msg_info", on_click=self._show_faq_dialog),
             Divider(),
@@ -198,8 +1683,8 @@ class SpammerPlugin(BasePlugin):
                 return
             faq_text = self._get_faq_text()
             # Parse the Markdown text for proper display in the dialog
-            parsed_faq = parse_markdown(faq_text)
-            builder = AlertDialogBuilder(activity)
+            parsed_faq = LazyImports.load("markdown_utils", "parse_markdown")(faq_text)
+            builder = _alert_dialog(activity)
             builder.set_title("Spammer Pro - FAQ")
             builder.set_message(parsed_faq.text if parsed_faq else faq_text)
             builder.set_positive_button("Close", lambda b, w: b.dismiss())
@@ -209,10 +1694,13 @@ class SpammerPlugin(BasePlugin):
 
     def _get_faq_text(self) -> str:
         """Constructs the FAQ text using the currently configured command names."""
-        cmd_spam = self.get_setting("cmd_spam", DEFAULT_SETTINGS["cmd_spam"])
-        cmd_spamdel = self.get_setting("cmd_spamdel", DEFAULT_SETTINGS["cmd_spamdel"])
-        cmd_stop = self.get_setting("cmd_stop", DEFAULT_SETTINGS["cmd_stop"])
-        cmd_spamdebuglog = self.get_setting("cmd_spamdebuglog", DEFAULT_SETTINGS["cmd_spamdebuglog"])
+        settings = self._get_settings()
+        cmd_spam = settings.cmd_spam
+        cmd_spamdel = settings.cmd_spamdel
+        cmd_stop = settings.cmd_stop
+        cmd_spamdebuglog = settings.cmd_spamdebuglog
+        cmd_spamstats = settings.cmd_spamstats
+        cmd_spamprofile = settings.cmd_spamprofile
 
         return f"""
 **🔐 ⚠️ DISCLAIMER – READ BEFORE USING ⚠️**
@@ -237,12 +1725,22 @@ Immediately stops any spam task that is currently running.
 `{cmd_spamdebuglog}`
 Saves a detailed log file for troubleshooting.
 
+`{cmd_spamstats}`
+Shows statistics of the running or last task: send latency, acknowledgements, errors, deletions and throughput.
+
+`{cmd_spamprofile} [calls] [cpu|mem]`
+Profiles the next task, or the next `calls` messages you send, and saves where time and memory went to the logs directory. Attach the file when reporting lag.
+
 **✍️ TEXT SPAM**
 
 **How do I spam text?**
 Use the format: `{cmd_spam} [text] [count]`
 **Example:** `{cmd_spam} Hello World [50]`
 
+**How do I number the messages?**
+Use `{{i}}` for the message number, `{{n}}` for the total count and `{{ts}}` for the send time (Unix ms).
+**Example:** `{cmd_spam} Test {{i}}/{{n}} [100]`
+
 **How do I add a delay?**
 Add the delay in seconds in a third bracket.
 **Example:** `{cmd_spam} Beep [10] [1.5]`
@@ -262,148 +1760,60 @@ Reply to any photo, sticker, video, or file with the command: `{cmd_spam} [count
 **Example:** `{cmd_spamdel} Boo! [10]`
 """
 
-    def start_spam_media_task(self, chat_id, remaining_count, input_media, delay_ms):
-        """Handles the recursive logic for spamming media."""
-        try:
-            # Stop condition: task cancelled or all messages sent
-            if not self.spam_active or remaining_count <= 0:
-                return self._cleanup_task()
-            # Prepare and send one media message
-            req = TLRPC.TL_messages_sendMedia()
-            req.peer = get_messages_controller().getInputPeer(chat_id)
-            req.random_id = random.getrandbits(63)
-            req.media = input_media
-            send_request(req, RequestCallback(lambda r, e: None))
-            self.messages_sent_count += 1
-            # If more messages are left, schedule the next one
-            if remaining_count > 1:
-                next_runnable = SpamTask(lambda: self.start_spam_media_task(chat_id, remaining_count - 1, input_media, delay_ms))
-                self.scheduled_task = next_runnable
-                self.main_thread_handler.postDelayed(self.scheduled_task, delay_ms)
-            else:
-                self._cleanup_task()
-        except Exception:
-            DebugLogger.make_log(f"ERROR in media spam: {traceback.format_exc()}")
-            self._cleanup_task()
-
-    def start_spamdel_media_task(self, chat_id, remaining_count, input_media, deletion_ms, delay_ms):
-        """Handles the recursive logic for spamming and then deleting media."""
-        try:
-            if not self.spam_active or remaining_count <= 0:
-                return self._cleanup_task()
-            
-            # Define a callback to handle the response after a message is sent
-            def handle_media_sent(response, error):
-                try:
-                    if error:
-                        raise Exception(f"TLRPC Error: {error.text}")
-                    self.messages_sent_count += 1
-                    message_id = self.extract_message_id(response)
-                    if not message_id:
-                        raise Exception("Could not get message ID to delete.")
-                    # Schedule the deletion of the sent message
-                    self.main_thread_handler.postDelayed(SpamTask(lambda mid=message_id: self._delete_single_message(chat_id, mid)), deletion_ms)
-                    # Schedule the next message if the task is still active
-                    if self.spam_active and remaining_count > 1:
-                        next_runnable = SpamTask(lambda: self.start_spamdel_media_task(chat_id, remaining_count - 1, input_media, deletion_ms, delay_ms))
-                        self.scheduled_task = next_runnable
-                        self.main_thread_handler.postDelayed(self.scheduled_task, delay_ms)
-                    else:
-                        self._cleanup_task()
-                except Exception:
-                    DebugLogger.make_log(f"ERROR in spamdel media callback: {traceback.format_exc()}")
-                    self._cleanup_task()
-            
-            # Prepare and send one media message, with the callback attached
-            req = TLRPC.TL_messages_sendMedia()
-            req.peer = get_messages_controller().getInputPeer(chat_id)
-            req.random_id = random.getrandbits(63)
-            req.media = input_media
-            send_request(req, RequestCallback(handle_media_sent))
-        except Exception:
-            DebugLogger.make_log(f"ERROR in spamdel media: {traceback.format_exc()}")
-            self._cleanup_task()
-
-    def start_spam_task(self, chat_id, text_to_spam, remaining_count, delay_ms, reply_to_msg_id, entities):
-        """Handles the recursive logic for spamming text messages."""
-        try:
-            if not self.spam_active or remaining_count <= 0:
-                return self._cleanup_task()
-            # Prepare and send one text message
-            req = TLRPC.TL_messages_sendMessage()
-            req.peer = get_messages_controller().getInputPeer(chat_id)
-            req.message = text_to_spam
-            req.random_id = random.getrandbits(63)
-            # Handle replies
-            if reply_to_msg_id:
-                req.reply_to = TLRPC.TL_inputReplyToMessage()
-                req.reply_to.reply_to_msg_id = reply_to_msg_id
-                req.flags |= 1
-            # Handle Markdown/formatting entities
-            if entities and not entities.isEmpty():
-                req.entities = entities
-                req.flags |= 8
-            send_request(req, RequestCallback(lambda r, e: None))
-            self.messages_sent_count += 1
-            # Schedule the next message
-            if remaining_count > 1:
-                next_runnable = SpamTask(lambda: self.start_spam_task(chat_id, text_to_spam, remaining_count - 1, delay_ms, reply_to_msg_id, entities))
-                self.scheduled_task = next_runnable
-                self.main_thread_handler.postDelayed(self.scheduled_task, delay_ms)
-            else:
-                self._cleanup_task()
-        except Exception:
-            DebugLogger.make_log(f"ERROR in text spam: {traceback.format_exc()}")
-            self._cleanup_task()
-
-    def start_spamdel_task(self, chat_id, text_to_spam, remaining_count, reply_to_msg_id, deletion_ms, delay_ms, entities):
-        """Handles the recursive logic for spamming and then deleting text messages."""
-        try:
-            if not self.spam_active or remaining_count <= 0:
-                return self._cleanup_task()
-            
-            def handle_message_sent(response, error):
-                try:
-                    if error:
-                        raise Exception(f"TLRPC Error: {error.text}")
-                    self.messages_sent_count += 1
-                    message_id = self.extract_message_id(response)
-                    if not message_id:
-                        raise Exception("Could not get message ID to delete.")
-                    # Schedule deletion
-                    self.main_thread_handler.postDelayed(SpamTask(lambda mid=message_id: self._delete_single_message(chat_id, mid)), deletion_ms)
-                    # Schedule next send
-                    if self.spam_active and remaining_count > 1:
-                        next_runnable = SpamTask(lambda: self.start_spamdel_task(chat_id, text_to_spam, remaining_count - 1, reply_to_msg_id, deletion_ms, delay_ms, entities))
-                        self.scheduled_task = next_runnable
-                        self.main_thread_handler.postDelayed(self.scheduled_task, delay_ms)
-                    else:
-                        self._cleanup_task()
-                except Exception:
-                    DebugLogger.make_log(f"ERROR in spamdel callback: {traceback.format_exc()}")
-                    self._cleanup_task()
-
-            req = TLRPC.TL_messages_sendMessage()
-            req.peer = get_messages_controller().getInputPeer(chat_id)
-            req.message = text_to_spam
-            req.random_id = random.getrandbits(63)
-            if reply_to_msg_id:
-                req.reply_to = TLRPC.TL_inputReplyToMessage()
-                req.reply_to.reply_to_msg_id = reply_to_msg_id
-                req.flags |= 1
-            if entities and not entities.isEmpty():
-                req.entities = entities
-                req.flags |= 8
-            send_request(req, RequestCallback(handle_message_sent))
-        except Exception:
-            DebugLogger.make_log(f"ERROR in spamdel: {traceback.format_exc()}")
-            self._cleanup_task()
+    def start_task(self, template, count: int, delay_ms: int, deletion_ms: int = None, window: int = 1):
+        """
+        Starts a spam task; with a deletion delay every sent message is deleted again,
+        keeping up to `window` sends awaiting their message ID at a time.
+        """
+        settings = self._get_settings()
+        self.rate_controller.configure(settings.rate_limit_per_sec)
+        # A profile session armed for the next task follows this one
+        profiler = self.profiler
+        if profiler is not None and not profiler.hooks_left:
+            self.profiler = None
+        else:
+            profiler = None
+        runner = TaskRunner(self, template, count, delay_ms, deletion_ms, window, profiler)
+        if profiler is not None:
+            profiler.start(f"{runner.label} task of {count} message(s)")
+        if settings.trace_tasks_to_file:
+            try:
+                runner.stats.trace = TaskTrace(settings.logs_directory, runner.label, count, delay_ms, deletion_ms)
+            except Exception:
+                DebugLogger.error("Failed to start the task trace: %s", traceback.format_exc())
+        with self.task_lock:
+            # Normally closed when the previous task drained; one still waiting for a response ends here
+            previous_stats = self.last_task_stats
+            self.last_task_stats = runner.stats
+            self.last_task = runner
+            self.scheduled_task = runner
+        if previous_stats is not None and previous_stats.trace is not None:
+            previous_stats.trace.close()
+        # The first send happens on the task thread, like all the others
+        self.task_handler.post(runner.runnable)
 
     def on_send_message_hook(self, account: int, params) -> HookResult:
         """
         The core function of the plugin. It intercepts every outgoing message
         to check if it's a spam command.
         """
+        profiler = self.profiler
+        if profiler is None or not profiler.hooks_left:
+            return self._handle_outgoing_message(account, params)
+        # Profiling the next N hook calls; tracing starts with the first of them, not when the session is armed
+        if profiler.started_at is None:
+            profiler.start(f"next {profiler.hooks_left} hook call(s)")
+        try:
+            return profiler.call(self._handle_outgoing_message, account, params)
+        finally:
+            profiler.hooks_left -= 1
+            if not profiler.hooks_left:
+                if self.profiler is profiler:
+                    self.profiler = None
+                profiler.finish()
+
+    def _handle_outgoing_message(self, account: int, params) -> HookResult:
+        """Classifies an outgoing message and runs the command it holds, if any."""
         try:
             # --- Initial Checks ---
             # Ignore non-text messages or messages without content
@@ -411,155 +1821,149 @@ Reply to any photo, sticker, video, or file with the command: `{cmd_spam} [count
                 return HookResult()
             message_text = params.message.strip()
 
-            # --- Get current command names from settings ---
-            cmd_stop = self.get_setting("cmd_stop", DEFAULT_SETTINGS["cmd_stop"])
-            cmd_spamdebuglog = self.get_setting("cmd_spamdebuglog", DEFAULT_SETTINGS["cmd_spamdebuglog"])
-            cmd_spam = self.get_setting("cmd_spam", DEFAULT_SETTINGS["cmd_spam"])
-            cmd_spamdel = self.get_setting("cmd_spamdel", DEFAULT_SETTINGS["cmd_spamdel"])
+            # --- Classify the message against the configured command names ---
+            settings = self._get_settings()
+            command_kind, command_args = self._command_dispatcher.classify(message_text)
+            if command_kind == CommandDispatcher.PASS:
+                return HookResult()  # Not a command, let it pass
 
             # --- Handle .spamstop command ---
-            if message_text.lower() == cmd_stop:
-                if self.spam_active:
-                    self.spam_active = False
-                    self._cleanup_task()
+            if command_kind == CommandDispatcher.STOP:
+                with self.task_lock:
+                    was_active = self.spam_active
+                    if was_active:
+                        self._cleanup_task(cancel=True)
+                        final_count = self.messages_sent_count
+                if was_active:
                     activity = get_last_fragment().getParentActivity()
                     if activity:
-                        self.show_stopped_dialog(activity, self.messages_sent_count)
+                        self.show_stopped_dialog(activity, final_count, self.last_task_stats.summary() if self.last_task_stats else "")
                 return HookResult(strategy=HookStrategy.CANCEL)  # Cancel sending ".spamstop"
             
+            # --- Handle .spamstats command ---
+            if command_kind == CommandDispatcher.STATS:
+                activity = get_last_fragment().getParentActivity()
+                if activity:
+                    stats_text = self.last_task_stats.summary() if self.last_task_stats else "No task has run yet."
+                    self.show_info_dialog(activity, "📊 Task Statistics", stats_text)
+                return HookResult(strategy=HookStrategy.CANCEL)
+
+            # --- Handle .spamprofile command ---
+            if command_kind == CommandDispatcher.PROFILE:
+                self.handle_profile_command(command_args, settings)
+                return HookResult(strategy=HookStrategy.CANCEL)
+
             # --- Handle .spamdebuglog command ---
-            if message_text.lower() == cmd_spamdebuglog:
-                log_dir = self.get_setting("logs_directory", DEFAULT_SETTINGS["logs_directory"])
+            if command_kind == CommandDispatcher.DEBUGLOG:
+                if self.last_task_stats:
+                    DebugLogger.info("Task statistics:\n%s", self.last_task_stats.summary())
+                DebugLogger.info("Import timings: %s", LazyImports.summary())
                 # Modify the message content to be the log file path
-                params.message = DebugLogger.save_logs(log_dir)
+                params.message = DebugLogger.save_logs(settings.logs_directory)
                 return HookResult(strategy=HookStrategy.MODIFY, params=params)
 
             # --- Prevent new spam commands while another is active ---
             if self.spam_active:
-                if message_text.lower().startswith((cmd_spam, cmd_spamdel)):
-                    # Silently cancel the new command if one is already running
-                    return HookResult(strategy=HookStrategy.CANCEL)
-                return HookResult()  # Let other messages pass through
+                # Silently cancel anything starting with a spam command while one is running
+                return HookResult(strategy=HookStrategy.CANCEL)
+            if command_kind == CommandDispatcher.SPAM_PREFIXED:
+                return HookResult()  # e.g. ".spammer", not a command when idle
 
             activity = get_last_fragment().getParentActivity()
             if not activity:
                 return HookResult(strategy=HookStrategy.CANCEL)
 
             # --- Parse the command type ---
-            is_delete_mode = False
-            command_args = None
-            is_repeat_command = False
-
-            if message_text.lower().startswith(f"{cmd_spamdel} "):
-                is_delete_mode = True
-                command_args = message_text[len(cmd_spamdel)+1:].strip()
-            elif message_text.lower().startswith(f"{cmd_spam} "):
-                command_args = message_text[len(cmd_spam)+1:].strip()
-            elif message_text.lower() == cmd_spamdel:
-                is_delete_mode = True
-                is_repeat_command = True
-            elif message_text.lower() == cmd_spam:
-                is_repeat_command = True
-            else:
-                return HookResult()  # Not a spam command, let it pass
+            is_delete_mode = command_kind in (CommandDispatcher.SPAMDEL, CommandDispatcher.SPAMDEL_REPEAT)
+            is_repeat_command = command_kind in (CommandDispatcher.SPAM_REPEAT, CommandDispatcher.SPAMDEL_REPEAT)
 
             # --- Handle repeating the last command ---
             if is_repeat_command:
-                if self.last_command_data:
-                    # Load parameters from the previously stored command
-                    command_args = self.last_command_data["args"]
-                    reply_to_msg_object = self.last_command_data["reply"]
-                    original_entities = self.last_command_data["entities"]
-                else:
+                record = self.last_command_data
+                if not record:
                     self.show_info_dialog(activity, "No Previous Command", "There is no command to repeat. Please see the FAQ for usage.")
                     return HookResult(strategy=HookStrategy.CANCEL)
+                # Reuse the stored parse result; only re-clamp if the limit was changed since
+                if record.max_limit != settings.max_spam_limit:
+                    record = self.last_command_data = record.with_max_limit(settings.max_spam_limit)
+                # A task may have renewed the media's file_reference since; the cache holds the current object
+                if record.input_media is not None:
+                    current_media = self.input_media_cache.get(InputMediaCache.key_for(record.input_media))
+                    if current_media is not None and current_media is not record.input_media:
+                        record = self.last_command_data = record._replace(input_media=current_media)
             else:
-                # Store parameters for a potential future repeat command
+                # Parse the command arguments into text, count, and delay
+                text_to_spam, raw_count, delay = self._parse_arguments(command_args)
+                final_entities = None
+                input_media = None
                 reply_to_msg_object = params.replyToMsg if hasattr(params, 'replyToMsg') else None
-                original_entities = params.entities if hasattr(params, 'entities') else None
-                self.last_command_data = {"args": command_args, "reply": reply_to_msg_object, "entities": original_entities}
+                if text_to_spam is not None:
+                    # Shift Markdown entity positions past the command prefix
+                    command_len_with_space = len(message_text) - len(command_args)
+                    original_entities = params.entities if hasattr(params, 'entities') else None
+                    final_entities = self._build_entities(original_entities, command_len_with_space)
+                else:
+                    # Resolve the replied-to media now, so the record does not need the message itself
+                    input_media = self.get_input_media_from_message(reply_to_msg_object)
+                reply_to_msg_id = reply_to_msg_object.messageOwner.id if reply_to_msg_object and hasattr(reply_to_msg_object, 'messageOwner') else None
+                # Store the parsed command for a potential future repeat command
+                record = self.last_command_data = CommandRecord(
+                    text_to_spam, raw_count, min(raw_count, settings.max_spam_limit), delay,
+                    final_entities, params.peer, reply_to_msg_id, input_media, settings.max_spam_limit,
+                )
+
+            # The task closures below capture these values only, never `params` or the reply message
+            peer = params.peer
+            text_to_spam, count, delay = record.text, record.count, record.delay
+            final_entities = record.entities
+            input_media = record.input_media
+            # A reply header only makes sense in the chat the command was first sent in
+            reply_to_msg_id = record.reply_msg_id if record.peer == peer else None
 
-            reply_to_msg_id = reply_to_msg_object.messageOwner.id if reply_to_msg_object and hasattr(reply_to_msg_object, 'messageOwner') else None
-            # Parse the command arguments into text, count, and delay
-            text_to_spam, count, delay = self.parse_command(command_args)
-            
             if count <= 0:
                  return HookResult(strategy=HookStrategy.CANCEL)
 
             # --- Logic for Media Spam (when replying to media) ---
             if text_to_spam is None:
-                input_media = self.get_input_media_from_message(reply_to_msg_object)
                 if input_media and count > 0:
-                    # Check for expired photo data which can cause crashes
-                    if isinstance(input_media, TLRPC.TL_inputMediaPhoto) and (not input_media.id.file_reference or len(input_media.id.file_reference) == 0):
-                        self.show_info_dialog(activity, "Spammer Error", "Cannot forward this photo, data expired.")
-                        return HookResult(strategy=HookStrategy.CANCEL)
-                    
+                    # An expired or missing file_reference is renewed from this message by the task
+                    media_source = (record.peer, record.reply_msg_id)
+
                     def start_media_action():
                         """The function that actually starts the media spam task."""
-                        self.spam_active = True
-                        self.messages_sent_count = 0
-                        try:
-                            media_delay_sec = float(self.get_setting('default_media_delay_sec', DEFAULT_SETTINGS["default_media_delay_sec"]))
-                            del_delay_sec = float(self.get_setting('default_deletion_delay_sec', DEFAULT_SETTINGS["default_deletion_delay_sec"]))
-                        except (ValueError, TypeError):
-                            media_delay_sec = DEFAULT_SETTINGS["default_media_delay_sec"]
-                            del_delay_sec = DEFAULT_SETTINGS["default_deletion_delay_sec"]
+                        with self.task_lock:
+                            self.spam_active = True
+                            self.messages_sent_count = 0
+                        action_settings = self._get_settings()
+                        media_delay_sec = action_settings.default_media_delay_sec
+                        del_delay_sec = action_settings.default_deletion_delay_sec
                         delay_ms = int(delay * 1000) if delay > 0 else int(media_delay_sec * 1000)
                         deletion_ms = int(del_delay_sec * 1000)
-                        if is_delete_mode:
-                            self.start_spamdel_media_task(params.peer, count, input_media, deletion_ms, delay_ms)
-                        else:
-                            self.start_spam_media_task(params.peer, count, input_media, delay_ms)
+                        template = SendTemplate(peer, input_media=input_media, media_source=media_source)
+                        self.start_task(template, count, delay_ms, deletion_ms if is_delete_mode else None, action_settings.spamdel_window)
 
                     # Show confirmation for high spam counts
-                    try:
-                        confirmation_threshold = int(float(self.get_setting("confirmation_threshold", DEFAULT_SETTINGS["confirmation_threshold"])))
-                    except (ValueError, TypeError):
-                        confirmation_threshold = DEFAULT_SETTINGS["confirmation_threshold"]
-                    if count > confirmation_threshold:
+                    if count > settings.confirmation_threshold:
                         self.show_confirmation_dialog(activity, count, start_media_action)
                     else:
                         start_media_action()
                 return HookResult(strategy=HookStrategy.CANCEL)
 
             # --- Logic for Text Spam ---
-            # Calculate the offset to correctly adjust Markdown entity positions
-            command_len_with_space = len(message_text) - len(command_args) if not is_repeat_command else 0
-            final_entities = ArrayList()
-            if original_entities:
-                # Loop through existing entities and shift their offsets
-                for i in range(original_entities.size()):
-                    entity = original_entities.get(i)
-                    if is_repeat_command or entity.offset >= command_len_with_space:
-                        new_entity = type(entity)()
-                        new_entity.offset = entity.offset - command_len_with_space if not is_repeat_command else entity.offset
-                        new_entity.length = entity.length
-                        if hasattr(entity, 'url'):
-                            new_entity.url = entity.url
-                        final_entities.add(new_entity)
-
             def start_text_action():
                 """The function that actually starts the text spam task."""
-                self.spam_active = True
-                self.messages_sent_count = 0
+                with self.task_lock:
+                    self.spam_active = True
+                    self.messages_sent_count = 0
                 delay_ms = int(delay * 1000)
-                try:
-                    del_delay_sec = float(self.get_setting('default_deletion_delay_sec', DEFAULT_SETTINGS["default_deletion_delay_sec"]))
-                except (ValueError, TypeError):
-                    del_delay_sec = DEFAULT_SETTINGS["default_deletion_delay_sec"]
+                action_settings = self._get_settings()
+                del_delay_sec = action_settings.default_deletion_delay_sec
                 deletion_ms = int((delay if delay > 0 else del_delay_sec) * 1000)
-                if is_delete_mode:
-                    self.start_spamdel_task(params.peer, text_to_spam, count, reply_to_msg_id, deletion_ms, delay_ms, final_entities)
-                else:
-                    self.start_spam_task(params.peer, text_to_spam, count, delay_ms, reply_to_msg_id, final_entities)
+                template = SendTemplate(peer, text=text_to_spam, reply_to_msg_id=reply_to_msg_id, entities=final_entities, count=count)
+                self.start_task(template, count, delay_ms, deletion_ms if is_delete_mode else None, action_settings.spamdel_window)
 
             # Show confirmation for high spam counts
-            try:
-                confirmation_threshold = int(float(self.get_setting("confirmation_threshold", DEFAULT_SETTINGS["confirmation_threshold"])))
-            except (ValueError, TypeError):
-                confirmation_threshold = DEFAULT_SETTINGS["confirmation_threshold"]
-            if count > confirmation_threshold:
+            if count > settings.confirmation_threshold:
                 self.show_confirmation_dialog(activity, count, start_text_action)
             else:
                 start_text_action()
@@ -570,29 +1974,35 @@ Reply to any photo, sticker, video, or file with the command: `{cmd_spam} [count
         except Exception as e:
             # --- Failsafe Error Handling ---
             tb_string = traceback.format_exc()
-            DebugLogger.make_log(f"FATAL ERROR in hook: {tb_string}")
-            self._cleanup_task()
+            DebugLogger.error("FATAL ERROR in hook: %s", tb_string)
+            self._cleanup_task(cancel=True)
             activity_for_error = get_last_fragment().getParentActivity()
             if activity_for_error and 'params' in locals():
                 self.show_error_dialog(activity_for_error, "Plugin Error", tb_string, params.peer)
             return HookResult(strategy=HookStrategy.CANCEL)
 
     def parse_command(self, command_args: str) -> (str, int, float):
+        """Parses the command arguments and clamps the count to the maximum spam limit."""
+        text_to_spam, count, delay = self._parse_arguments(command_args)
+        # Enforce the maximum spam limit from settings
+        return text_to_spam, min(count, self._get_settings().max_spam_limit), delay
+
+    def _parse_arguments(self, command_args: str) -> (str, int, float):
         """
         Parses the command arguments to extract text, count, and delay.
         Supports two formats:
-        1. [text] [count] [delay] (delay is optional) - handled by regex
+        1. [text] [count] [delay] (delay is optional) - scanned from the end
         2. [text] [count] - handled by string splitting
         """
         text_to_spam, count, delay = None, 0, 0.0
-        # Regex for format: `some text [count]` or `some text [count] [delay]`
-        match = re.search(r'^(.*?)?[\s\u2063]*\[(\d+)\](?:[\s\u2063]*\[([0-9.]+)\])?$', command_args.strip())
+        # Format: `some text [count]` or `some text [count] [delay]`
+        match = _match_bracket_arguments(command_args)
         if match:
-            text_content = match.group(1)
-            text_to_spam = text_content.strip() if text_content else None
-            count = int(match.group(2))
-            if match.group(3):
-                delay = float(match.group(3))
+            text_start, text_end, count_text, delay_text = match
+            text_to_spam = command_args[text_start:text_end].strip() if text_end > text_start else None
+            count = int(count_text)
+            if delay_text:
+                delay = float(delay_text)
         else:
             # Fallback for format: `some text count`
             parts = command_args.rsplit(' ', 1)
@@ -606,21 +2016,31 @@ Reply to any photo, sticker, video, or file with the command: `{cmd_spam} [count
         
         if text_to_spam == "":
             text_to_spam = None
-        
-        # Enforce the maximum spam limit from settings
-        try:
-            max_limit = int(float(self.get_setting("max_spam_limit", DEFAULT_SETTINGS["max_spam_limit"])))
-        except (ValueError, TypeError):
-            max_limit = DEFAULT_SETTINGS["max_spam_limit"]
-        return text_to_spam, min(count, max_limit), delay
-    
+        return text_to_spam, count, delay
+
+    def _build_entities(self, original_entities, offset_shift: int):
+        """Copies the entities that fall inside the spammed text, shifted to its start."""
+        final_entities = ArrayList()
+        if original_entities:
+            # Loop through existing entities and shift their offsets
+            for i in range(original_entities.size()):
+                entity = original_entities.get(i)
+                if entity.offset >= offset_shift:
+                    new_entity = type(entity)()
+                    new_entity.offset = entity.offset - offset_shift
+                    new_entity.length = entity.length
+                    if hasattr(entity, 'url'):
+                        new_entity.url = entity.url
+                    final_entities.add(new_entity)
+        return final_entities
+
     def show_confirmation_dialog(self, activity, count, on_confirm_action):
         """Displays a confirmation dialog for high spam counts."""
         def show_dialog():
             def on_confirm(bld, w):
                 on_confirm_action()
                 bld.dismiss()
-            builder = AlertDialogBuilder(activity)
+            builder = _alert_dialog(activity)
             builder.set_title("⚠️ High Spam Count")
             builder.set_message(f"You are about to send {count} items.\n\nAre you sure?")
             builder.set_positive_button("Proceed", on_confirm)
@@ -628,18 +2048,44 @@ Reply to any photo, sticker, video, or file with the command: `{cmd_spam} [count
             builder.show()
         run_on_ui_thread(show_dialog)
         
+    def handle_profile_command(self, command_args: str, settings: SettingsSnapshot):
+        """Arms a ProfileSession: `[calls] [cpu|mem|all]` profiles the next `calls` hook calls, or the next task without a count."""
+        hook_calls, mode = 0, "all"
+        for token in command_args.lower().split():
+            if token.isdigit() and int(token) > 0:
+                hook_calls = int(token)
+            elif token in ProfileSession.MODES:
+                mode = token
+            else:
+                activity = get_last_fragment().getParentActivity()
+                if activity:
+                    self.show_info_dialog(activity, "Profiling", f"Unknown argument: {token}\n\nUsage: {settings.cmd_spamprofile} [calls] [cpu|mem]")
+                return
+        if self.profiler is not None:
+            self.profiler.finish()  # Replaced: save what the previous session captured
+        session = ProfileSession(settings.logs_directory, hook_calls, mode)
+        if hook_calls:
+            target = f"the next {hook_calls} message(s) you send"
+        else:
+            target = "the next spam task"
+        self.profiler = session
+        activity = get_last_fragment().getParentActivity()
+        if activity:
+            kinds = {"all": "Time and memory", "cpu": "Time", "mem": "Memory"}[mode]
+            self.show_info_dialog(activity, "Profiling", f"{kinds} will be profiled for {target}.\n\nThe report is saved to: {settings.logs_directory}")
+
     def show_info_dialog(self, activity, title, message):
         """Displays a simple informational dialog."""
         def show_dialog():
             if not activity: return
             try:
-                builder = AlertDialogBuilder(activity)
+                builder = _alert_dialog(activity)
                 builder.set_title(title)
                 builder.set_message(message)
                 builder.set_positive_button("OK", lambda b, w: b.dismiss())
                 builder.show()
             except Exception:
-                DebugLogger.make_log(f"ERROR showing info dialog: {traceback.format_exc()}")
+                DebugLogger.error("ERROR showing info dialog: %s", traceback.format_exc())
         run_on_ui_thread(show_dialog)
 
     def get_input_media_from_message(self, message_object):
@@ -649,75 +2095,89 @@ Reply to any photo, sticker, video, or file with the command: `{cmd_spam} [count
         media = getattr(message_object.messageOwner, "media", None)
         if not media:
             return None
+        return self.resolve_input_media(media)
+
+    def resolve_input_media(self, media, refreshed: bool = False):
+        """
+        Returns the InputMedia for a photo or document message media. The cached
+        object is reused unless the media brings a different file_reference;
+        `refreshed` media (just re-fetched from the server) always replaces it.
+        """
         # Handle photos
-        if isinstance(media, TLRPC.TL_messageMediaPhoto) and hasattr(media, "photo"):
-            photo = media.photo
-            if not isinstance(photo, TLRPC.TL_photo):
-                return None
+        if isinstance(media, TLRPC.TL_messageMediaPhoto) and isinstance(getattr(media, "photo", None), TLRPC.TL_photo):
+            file, key = media.photo, ("photo", media.photo.id)
+        # Handle documents (stickers, files, videos)
+        elif isinstance(media, TLRPC.TL_messageMediaDocument) and isinstance(getattr(media, "document", None), TLRPC.TL_document):
+            file, key = media.document, ("document", media.document.id)
+        else:
+            return None
+        file_reference = file.file_reference if file.file_reference is not None else bytearray(0)
+        cached = self.input_media_cache.get(key)
+        if cached is not None and not refreshed and (len(file_reference) == 0 or bytes(cached.id.file_reference) == bytes(file_reference)):
+            return cached
+        if key[0] == "photo":
             input_media = TLRPC.TL_inputMediaPhoto()
             input_media.id = TLRPC.TL_inputPhoto()
-            input_media.id.id = photo.id
-            input_media.id.access_hash = photo.access_hash
-            input_media.id.file_reference = photo.file_reference if photo.file_reference is not None else bytearray(0)
-            return input_media
-        # Handle documents (stickers, files, videos)
-        if isinstance(media, TLRPC.TL_messageMediaDocument) and hasattr(media, "document"):
-            doc = media.document
-            if not isinstance(doc, TLRPC.TL_document):
-                return None
+        else:
             input_media = TLRPC.TL_inputMediaDocument()
             input_media.id = TLRPC.TL_inputDocument()
-            input_media.id.id = doc.id
-            input_media.id.access_hash = doc.access_hash
-            input_media.id.file_reference = doc.file_reference if doc.file_reference is not None else bytearray(0)
-            return input_media
+        input_media.id.id = file.id
+        input_media.id.access_hash = file.access_hash
+        input_media.id.file_reference = file_reference
+        self.input_media_cache.put(key, input_media)
+        return input_media
+
+    def find_message_media(self, response, message_id: int):
+        """Returns the media of the message with the given id in a getMessages response."""
+        messages = getattr(response, "messages", None)
+        for i in range(messages.size() if messages else 0):
+            message = messages.get(i)
+            if message.id == message_id:
+                return getattr(message, "media", None)
         return None
 
-    def show_stopped_dialog(self, activity, final_count: int):
+    def show_stopped_dialog(self, activity, final_count: int, stats_text: str = ""):
         """Displays a dialog confirming that the spam task was stopped."""
         def show_dialog():
             if not activity: return
             try:
-                builder = AlertDialogBuilder(activity)
+                builder = _alert_dialog(activity)
                 builder.set_title("✅ Task Stopped")
-                builder.set_message(f"The spam task was successfully stopped.\n\nItems sent: {final_count}")
+                message = f"The spam task was successfully stopped.\n\nItems sent: {final_count}"
+                if stats_text:
+                    message += f"\n\n{stats_text}"
+                builder.set_message(message)
                 builder.set_positive_button("OK", lambda b, w: b.dismiss())
                 builder.show()
             except Exception:
-                DebugLogger.make_log(f"ERROR showing stopped dialog: {traceback.format_exc()}")
+                DebugLogger.error("ERROR showing stopped dialog: %s", traceback.format_exc())
         run_on_ui_thread(show_dialog)
 
-    def _delete_single_message(self, chat_id, message_id):
-        """Sends a request to delete a single message by its ID."""
-        try:
-            id_list = ArrayList()
-            id_list.add(Integer(message_id))
-            channel_id = 0
-            # Handle channel IDs which are different from group/user IDs
-            if str(chat_id).startswith("-100"):
-                channel_id = int(str(chat_id)[4:])
-            get_messages_controller().deleteMessages(id_list, None, None, chat_id, 0, True, channel_id)
-        except Exception:
-            DebugLogger.make_log(f"ERROR deleting message ID {message_id}: {traceback.format_exc()}")
-
-    def extract_message_id(self, response) -> int:
-        """Extracts the message ID from various possible TLRPC response types."""
+    def extract_sent_ids(self, response) -> list:
+        """
+        Returns (random_id, message_id) pairs for the messages confirmed by a send response.
+        random_id is None for response types that do not carry it (e.g. updateShortSentMessage).
+        """
         if isinstance(response, TLRPC.TL_updateShortSentMessage):
-            return response.id
+            return [(None, response.id)]
+        sent_ids = []
+        new_message_id = None
         if hasattr(response, "updates") and response.updates:
             for i in range(response.updates.size()):
                 update = response.updates.get(i)
-                if isinstance(update, TLRPC.TL_updateNewMessage) and hasattr(update, "message"):
-                    return update.message.id
-                elif isinstance(update, TLRPC.TL_updateMessageID):
-                    return update.id
-        return None
+                if isinstance(update, TLRPC.TL_updateMessageID):
+                    sent_ids.append((update.random_id, update.id))
+                elif new_message_id is None and isinstance(update, TLRPC.TL_updateNewMessage) and hasattr(update, "message"):
+                    new_message_id = update.message.id
+        if not sent_ids and new_message_id:
+            sent_ids.append((None, new_message_id))
+        return sent_ids
 
     def show_error_dialog(self, activity, title: str, full_error_text: str, chat_id: int):
         """Displays a detailed error dialog with an option to send the log to the chat."""
         def show_dialog():
             if not activity: return
-            builder = AlertDialogBuilder(activity)
+            builder = _alert_dialog(activity)
             builder.set_title(title)
             builder.set_message(full_error_text)
             # Add a button to easily send the error log for debugging
@@ -728,3 +2188,5 @@ Reply to any photo, sticker, video, or file with the command: `{cmd_spam} [count
             builder.set_negative_button("Dismiss", lambda b, w: b.dismiss())
             builder.show()
         run_on_ui_thread(show_dialog)
+
+LazyImports.timings["plugin module"] = (time.perf_counter() - _import_started) * 1000
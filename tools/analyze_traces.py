@@ -0,0 +1,236 @@
+"""
+Offline analyzer for task traces saved with the "Save Task Traces" setting.
+
+Streams one or more trace-<uuid>.jsonl.gz files (or directories holding them)
+record by record, so traces of any size and from any number of devices can be
+combined without loading a file into memory. For every task and for all tasks
+together it reports the request-to-response latency percentiles, the achieved
+send, acknowledgement and deletion rates, and a breakdown of the errors.
+
+    python tools/analyze_traces.py /sdcard/Download/spammer_logs
+    python tools/analyze_traces.py trace-a.jsonl.gz trace-b.jsonl.gz --json
+    python tools/analyze_traces.py logs/ --totals-only
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import sys
+from collections import Counter
+
+PERCENTILES = (0.50, 0.90, 0.99)
+
+
+class TaskSummary:
+    """Running aggregates of one task (or of several merged); memory grows with distinct latencies, not records."""
+    def __init__(self, task_id, kind=None, count=None):
+        self.task_id = task_id
+        self.kind = kind
+        self.count = count
+        self.sends = 0
+        self.acks = 0
+        self.deleted = 0
+        self.delete_requests = 0
+        self.errors = Counter()
+        self.latencies = Counter()  # Latency in ms -> responses
+        self.first_send = self.last_send = None
+        self.first_ack = self.last_ack = None
+        self.first_delete = self.last_delete = None
+        self.stop = None
+        self.send_span_ms = 0  # Only used by merged summaries, where spans of different clocks are added up
+        self.ack_span_ms = 0
+        self.delete_span_ms = 0
+
+    def add(self, record):
+        event = record.get("ev")
+        now = record.get("t")
+        if event == "task":
+            self.kind = record.get("kind")
+            self.count = record.get("count")
+        elif event == "send":
+            self.sends += 1
+            self.first_send, self.last_send = _extend(self.first_send, self.last_send, now)
+        elif event == "ack":
+            self.acks += 1
+            self.first_ack, self.last_ack = _extend(self.first_ack, self.last_ack, now)
+        elif event == "err":
+            self.errors[record.get("err") or "UNKNOWN"] += 1
+        elif event == "del":
+            self.deleted += record.get("n", 0)
+            self.delete_requests += 1
+            self.first_delete, self.last_delete = _extend(self.first_delete, self.last_delete, now)
+        elif event == "stop":
+            self.stop = record
+        latency = record.get("lat")
+        if latency is not None:
+            self.latencies[latency] += 1
+
+    def merge(self, other):
+        """Adds another task's aggregates; rates are then computed over the sum of the tasks' active spans."""
+        self.sends += other.sends
+        self.acks += other.acks
+        self.deleted += other.deleted
+        self.delete_requests += other.delete_requests
+        self.errors.update(other.errors)
+        self.latencies.update(other.latencies)
+        self.send_span_ms += other.span("send")
+        self.ack_span_ms += other.span("ack")
+        self.delete_span_ms += other.span("delete")
+
+    def span(self, what):
+        if self.task_id is None:
+            return {"send": self.send_span_ms, "ack": self.ack_span_ms, "delete": self.delete_span_ms}[what]
+        first, last = getattr(self, f"first_{what}"), getattr(self, f"last_{what}")
+        return (last - first) if first is not None else 0
+
+    def rate(self, events, what):
+        # n events of one task span n - 1 intervals; merged summaries approximate with n over the summed spans
+        span = self.span(what)
+        if self.task_id is not None:
+            events -= 1
+        return events * 1000 / span if span > 0 and events > 0 else 0.0
+
+    def latency_percentiles(self):
+        total = sum(self.latencies.values())
+        result = {}
+        if not total:
+            return result
+        ordered = sorted(self.latencies.items())
+        for fraction in PERCENTILES:
+            rank = max(1, math.ceil(fraction * total))
+            seen = 0
+            for latency, count in ordered:
+                seen += count
+                if seen >= rank:
+                    result[f"p{int(fraction * 100)}"] = latency
+                    break
+        result["max"] = ordered[-1][0]
+        result["mean"] = round(sum(latency * count for latency, count in ordered) / total, 1)
+        return result
+
+    def report(self):
+        return {
+            "task": self.task_id,
+            "kind": self.kind,
+            "count": self.count,
+            "sends": self.sends,
+            "acks": self.acks,
+            "errors": sum(self.errors.values()),
+            "deleted": self.deleted,
+            "delete_requests": self.delete_requests,
+            "send_rate": round(self.rate(self.sends, "send"), 2),
+            "ack_rate": round(self.rate(self.acks, "ack"), 2),
+            "delete_rate": round(self.rate(self.delete_requests, "delete"), 2),
+            "latency_ms": self.latency_percentiles(),
+            "error_breakdown": dict(self.errors.most_common()),
+            "stopped": self.stop is not None,
+        }
+
+
+def _extend(first, last, now):
+    if now is None:
+        return first, last
+    return (now if first is None else min(first, now)), (now if last is None else max(last, now))
+
+
+def trace_files(paths):
+    """Yields the trace files named or contained (non-recursively) in the given paths."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.startswith("trace-") and name.endswith((".jsonl", ".jsonl.gz")):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def read_records(path, problems):
+    """Yields the records of one trace file line by line; unreadable lines and empty files are counted and skipped."""
+    opener = gzip.open if path.endswith(".gz") else open
+    records = 0
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    problems["malformed lines"] += 1
+                    continue
+                records += 1
+                yield record
+    except (OSError, EOFError):
+        # A trace cut short (e.g. the app was killed) still yields the records written before
+        problems["truncated or unreadable files"] += 1
+        return
+    if not records:
+        # The trace of a task that had not finished yet is only written out once the task drains
+        problems["empty files (task still running?)"] += 1
+
+
+def analyze(paths):
+    tasks = {}
+    problems = Counter()
+    files = 0
+    for path in trace_files(paths):
+        files += 1
+        for record in read_records(path, problems):
+            task_id = record.get("task")
+            summary = tasks.get(task_id)
+            if summary is None:
+                summary = tasks[task_id] = TaskSummary(task_id)
+            summary.add(record)
+    totals = TaskSummary(None, kind="all")
+    for summary in tasks.values():
+        totals.merge(summary)
+    return {
+        "files": files,
+        "problems": dict(problems),
+        "tasks": [summary.report() for summary in tasks.values()],
+        "totals": totals.report(),
+    }
+
+
+def _format_row(row, label):
+    latency = row["latency_ms"]
+    latency_text = (f"p50 {latency['p50']} / p90 {latency['p90']} / p99 {latency['p99']} / max {latency['max']} ms"
+                    if latency else "no latencies")
+    lines = [
+        f"{label}: {row['sends']} sent, {row['acks']} acknowledged, {row['errors']} errors, "
+        f"{row['deleted']} deleted in {row['delete_requests']} requests{' (stopped)' if row['stopped'] else ''}",
+        f"  rates: {row['send_rate']:.2f} sends/s, {row['ack_rate']:.2f} acks/s, {row['delete_rate']:.2f} delete requests/s",
+        f"  latency: {latency_text}",
+    ]
+    if row["error_breakdown"]:
+        lines.append("  errors: " + ", ".join(f"{text} ×{count}" for text, count in row["error_breakdown"].items()))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="Trace files, or directories holding trace-*.jsonl.gz files.")
+    parser.add_argument("--totals-only", action="store_true", help="Only report all tasks together.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    report = analyze(args.paths)
+    if args.totals_only:
+        report["tasks"] = []
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return 0
+    print(f"{report['files']} file(s), {len(report['tasks'])} task(s)")
+    for problem, count in report["problems"].items():
+        print(f"warning: {count} {problem}")
+    for row in report["tasks"]:
+        print()
+        print(_format_row(row, f"task {row['task']} ({row['kind']}, {row['count']} requested)"))
+    print()
+    print(_format_row(report["totals"], "all tasks"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())